@@ -32,7 +32,7 @@ def get_MeSH_terms(pmid):
     SELECT 
         descriptor_name
     FROM 
-        pubmed.tbl_mesh_heading
+        """+schema+""".tbl_mesh_heading
     WHERE
         fk_pmid = '"""+pmid+"""'
     ;
@@ -72,6 +72,7 @@ if __name__=="__main__":
     parser.add_option("-b", "--bioc", dest="b", help='name of the XML Document Type Definition file (DTD file) presenting BioC semantics', default="BioC.dtd")
     parser.add_option("-o", "--outfile", dest="o", help='name of the output file with annotated MeSH terms in BioC XML format', default="annotated_text_BioC.xml")#annotated_text_PubTator.xml
     parser.add_option("-d", "--database", dest="d", help='name of the database to connect to', default="pancreatic_cancer_db")
+    parser.add_option("-u", "--subset", dest="u", help='name of a subset created with PubMedSubset.py that is queried instead of the schema pubmed (optional)', default=None)
     
     (options, args) = parser.parse_args()
 
@@ -83,6 +84,8 @@ if __name__=="__main__":
     postgres_db         = options.d
     connection = psycopg2.connect("dbname='"+postgres_db+"' user='"+postgres_user+"' host='"+postgres_host+"' password='"+postgres_password+"' port='"+postgres_port+"'")
     cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    # schema of the tables (a subset schema has the same tables)
+    schema = options.u or "pubmed"
 
     # save file names in an extra variable
     input_file  = options.i
@@ -35,9 +35,9 @@ def get_title_text(pmid):
         article_title as title,
         abstract_text as abstract
     FROM 
-        pubmed.tbl_medline_citation
+        """+schema+""".tbl_medline_citation
             LEFT OUTER JOIN
-        pubmed.tbl_abstract
+        """+schema+""".tbl_abstract
                 ON pmid = fk_pmid
     WHERE
         pmid = '"""+pmid+"""'
@@ -90,6 +90,7 @@ if __name__=="__main__":
     parser.add_option("-i", "--infile", dest="i", help='name of the input file containing all PubMed-IDs', default="pmid_list.txt")
     parser.add_option("-o", "--outfile", dest="o", help='name of the output file containing all abstract titles and texts in BioC format', default="text_BioC.xml")
     parser.add_option("-d", "--database", dest="d", help='name of the database to connect to', default="pancreatic_cancer_db")
+    parser.add_option("-u", "--subset", dest="u", help='name of a subset created with PubMedSubset.py that is queried instead of the schema pubmed (optional)', default=None)
     
     (options, args) = parser.parse_args()
     
@@ -107,6 +108,8 @@ if __name__=="__main__":
     # connect to database
     connection = psycopg2.connect("dbname='"+postgres_db+"' user='"+postgres_user+"' host='"+postgres_host+"' password='"+postgres_password+"' port='"+postgres_port+"'")
     cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    # schema of the tables (a subset schema has the same tables)
+    schema = options.u or "pubmed"
 
     # get PubMed-IDs
     pmids = get_pmids(infile)
@@ -0,0 +1,12 @@
+-- PMC IDs are parsed from the ArticleIdList of the MEDLINE XML files into pubmed.tbl_article_id,
+-- so this view replaces the table tbl_pmcid_pmid and the import of PMC-ids.csv
+-- (only PMC IDs of citations in the database are contained)
+CREATE OR REPLACE VIEW tbl_pmcid_pmid AS
+  SELECT
+    article_id AS pmcid,
+    fk_pmid AS pmid
+  FROM
+    pubmed.tbl_article_id
+  WHERE
+    article_id_type = 'pmc';
+
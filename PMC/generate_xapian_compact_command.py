@@ -7,6 +7,10 @@
 # import modules
 # path options
 import os
+import sys
+# to merge into a new version of the index while the previous one is searched
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "full_text_index"))
+from IndexVersions import stageVersion, publishVersion
 
 # get all indexing directories from ids.txt and prepare compact command
 command = "xapian-compact -m "
@@ -20,9 +24,14 @@ for line in infile:
     index = int(temp[0]) - 1
     # add folder id to compact command (with system-dependent path separator)
     command += "xapian" + os.path.sep + str(index) + " "
-# add directory name which will contain the fully merged Xapian index
-command += "xapian_PMC_complete"
+# add directory name which will contain the fully merged Xapian index - a new version in "xapian_PMC_complete.versions",
+# which is published as "xapian_PMC_complete" after xapian-compact has finished
+versions, version = stageVersion("xapian_PMC_complete")
+command += os.path.join(versions, version)
 
 # execute xapian-compact command
 print command
-os.system(command)
+if os.system(command) != 0:
+    sys.exit("xapian-compact failed - the previous version of xapian_PMC_complete is still used")
+publishVersion("xapian_PMC_complete", version)
+print "version " + version + " of xapian_PMC_complete published"
@@ -16,6 +16,9 @@ import psycopg2
 from psycopg2 import extras
 # runtime
 import time
+# to build a new version of the indexes while the previous one is searched
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "full_text_index"))
+from IndexVersions import stageVersion, publishVersion
 
 # get PMC ID from tbl_pmcid_name_pmid for the considered file name
 def get_PMC(name):
@@ -69,8 +72,11 @@ root = os.getcwd()
 f_ids = open(os.path.join(root,"ids.txt"),"w")
 # some files do not contain a PMC ID (from file_list.txt)
 f_log = open(os.path.join(root,"files_without_pmc.txt"),"w")
-# directory xapian has to be created before
-xapianPath = os.path.join( root, "xapian" )
+# the indexes are built as a new version in "xapian.versions" and the link "xapian" points to it when all journals
+# are indexed, so search.py can be used with the previous version in the meantime (see full_text_index/IndexVersions.py)
+xapianPath, version = stageVersion(os.path.join( root, "xapian" ))
+xapianPath = os.path.join( xapianPath, version )
+os.makedirs(xapianPath)
 
 # get all journal directories
 directories = os.listdir(os.path.join(root,filePath))
@@ -151,6 +157,10 @@ f_log.close()
 # close PostgreSQL connection
 connection.close()
 
+# search the new version of the indexes from now on, the previous version is kept
+publishVersion(os.path.join( root, "xapian" ), version)
+print "version " + version + " of the indexes in the directory xapian published"
+
 # show end of the calculation in command-line
 end = time.asctime()
 print "programme started - " + start
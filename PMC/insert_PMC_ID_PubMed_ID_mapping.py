@@ -43,7 +43,7 @@ for index, line in enumerate(infile):
         pmid = temp[1]
     else:
         pmid = "Null"
-    insert_IDs(pmcid, pmid)
+    insert_IDs_and_Name(pmcid, pmid)
 
 # show final number of PMC IDs
 print index, "PMC IDs inserted"
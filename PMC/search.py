@@ -7,6 +7,9 @@
 # import modules
 # to connect to Xapian
 import xappy
+# to search several indexes as one database
+import xapian
+import cPickle
 # debug: sys.exit(0)
 import sys
 # path options
@@ -25,15 +28,45 @@ output = True
 verbose = True
 debug = False
 use_psql = True
+# search the index of each journal built by index.py in the directory "xapian" as one combined database instead of
+# "xapian_PMC_complete" - new journal indexes are searched as soon as they exist, xapian-compact is not needed
+use_shards = False
 
 # get path to this script
 root = os.getcwd()
 
 # search connection to Xapian full text index
-xapianPath   =  os.path.join( root, "xapian_PMC_complete" )
+if use_shards:
+    shardPath = os.path.join( root, "xapian" )
+    shards = [name for name in os.listdir(shardPath) if name.isdigit()]
+    shards.sort(key=int)
+    # all journal indexes have the same fields, so the queries are built with the connection to the first one
+    xapianPath = os.path.join( shardPath, shards[0] )
+    database = xapian.Database()
+    for name in shards:
+        database.add_database(xapian.Database(os.path.join(shardPath, name)))
+else:
+    xapianPath   =  os.path.join( root, "xapian_PMC_complete" )
 searchConn = xappy.SearchConnection(xapianPath)
 searchConn.reopen()
 
+# search result of the combined database with the attributes of a xappy search result used below
+class ShardResult(object):
+    def __init__(self, document):
+        self.document = document
+        # PMC ID from the ID term "Q<PMC ID>"
+        self.id = document.termlist().skip_to('Q').term[1:]
+    @property
+    def data(self):
+        # stored fields (only if use_psql was set to False in index.py)
+        return cPickle.loads(self.document.get_data())
+
+# all matching documents of the combined database, sorted by relevance
+def search_shards(query):
+    enquire = xapian.Enquire(database)
+    enquire.set_query(query)
+    return [ShardResult(match.document) for match in enquire.get_mset(0, database.get_doccount())]
+
 # get PMC texts from PostgreSQL
 def get_text(pmcid):
     stmt = """
@@ -78,7 +111,10 @@ for term in synonyms:
     if verbose:
         print query
     # search and get results
-    results=searchConn.search(query, 0, searchConn.get_doccount())
+    if use_shards:
+        results = search_shards(query)
+    else:
+        results=searchConn.search(query, 0, searchConn.get_doccount())
     # iterate over results
     for r in results:
         # write to file if option output:
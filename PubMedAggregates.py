@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+    Copyright (c) 2014, Bjoern Gruening <bjoern.gruening@gmail.com>, Kersten Doering <kersten.doering@gmail.com>
+
+    This script maintains the aggregate tables of the pubmed schema (defined in PubMedDB.py), i.e. the number of
+    publications per author, year, journal, country, and MeSH descriptor per year.
+    PubMedParser.py (option -a) updates them incrementally for every citation it inserts or deletes,
+    calling this script directly rebuilds all aggregate tables from scratch.
+"""
+
+from sqlalchemy import text
+
+import PubMedDB
+
+
+SCHEMA = PubMedDB.SCHEMA
+
+# (table, key columns, SELECT returning the key columns, labels, and the number of publications)
+# %(filter)s restricts the rows to the given PubMed-IDs, %(schema)s is the schema of the source tables,
+# %(sign)d is 1 for adding and -1 for subtracting citations
+AGGREGATES = [
+    ("tbl_author_count", ("last_name", "fore_name"), ("last_name", "fore_name", "publications"), """
+        SELECT
+            coalesce(last_name, ''), coalesce(fore_name, ''), %(sign)d * count(DISTINCT fk_pmid)
+        FROM
+            %(schema)s.tbl_author
+        WHERE
+            %(filter)s
+        GROUP BY
+            1, 2
+        ORDER BY
+            1, 2
+    """),
+    ("tbl_year_count", ("pub_date_year",), ("pub_date_year", "publications"), """
+        SELECT
+            pub_date_year, %(sign)d * count(DISTINCT fk_pmid)
+        FROM
+            %(schema)s.tbl_journal
+        WHERE
+            pub_date_year IS NOT NULL AND %(filter)s
+        GROUP BY
+            1
+        ORDER BY
+            1
+    """),
+    ("tbl_journal_count", ("nlm_unique_id",), ("nlm_unique_id", "medline_ta", "publications"), """
+        SELECT
+            coalesce(nlm_unique_id, ''), max(medline_ta), %(sign)d * count(DISTINCT fk_pmid)
+        FROM
+            %(schema)s.tbl_medline_journal_info
+        WHERE
+            %(filter)s
+        GROUP BY
+            1
+        ORDER BY
+            1
+    """),
+    ("tbl_country_count", ("country",), ("country", "publications"), """
+        SELECT
+            country, %(sign)d * count(DISTINCT fk_pmid)
+        FROM
+            %(schema)s.tbl_medline_journal_info
+        WHERE
+            country IS NOT NULL AND %(filter)s
+        GROUP BY
+            1
+        ORDER BY
+            1
+    """),
+    ("tbl_mesh_year_count", ("descriptor_ui", "pub_date_year"), ("descriptor_ui", "pub_date_year", "descriptor_name", "publications"), """
+        SELECT
+            m.descriptor_ui, j.pub_date_year, max(m.descriptor_name), %(sign)d * count(DISTINCT m.fk_pmid)
+        FROM
+            %(schema)s.tbl_mesh_heading m
+                INNER JOIN
+            %(schema)s.tbl_journal j
+                    ON j.fk_pmid = m.fk_pmid
+        WHERE
+            m.descriptor_ui IS NOT NULL AND j.pub_date_year IS NOT NULL AND %(filter)s
+        GROUP BY
+            1, 2
+        ORDER BY
+            1, 2
+    """),
+]
+
+
+def select_statement(select, schema, filter="TRUE", sign=1):
+    """
+        fill in the placeholders of one of the SELECT statements in AGGREGATES
+        (also used by PubMedSubset.py to define aggregate views on a subset schema)
+    """
+    return select % {"schema": schema, "filter": filter, "sign": int(sign)}
+
+
+def _upsert_statement(table, keys, columns, select, filter, sign):
+    """
+        build the INSERT ... ON CONFLICT statement that adds the selected counts to an aggregate table
+        (the ORDER BY in the SELECT makes concurrent parser processes lock the rows in the same order)
+    """
+    labels = [column for column in columns if column not in keys and column != "publications"]
+    updates = ["publications = %s.publications + EXCLUDED.publications" % (table,)]
+    updates += ["%s = coalesce(EXCLUDED.%s, %s.%s)" % (label, label, table, label) for label in labels]
+    return """
+        INSERT INTO %(schema)s.%(table)s (%(columns)s)
+        %(select)s
+        ON CONFLICT (%(keys)s) DO UPDATE SET %(updates)s
+        ;
+    """ % {"schema": SCHEMA,
+           "table": table,
+           "columns": ", ".join(columns),
+           "select": select_statement(select, SCHEMA, filter, sign),
+           "keys": ", ".join(keys),
+           "updates": ", ".join(updates)}
+
+
+def update(connection, pmids, sign=1):
+    """
+        add (sign=1) or subtract (sign=-1) the citations with the given PubMed-IDs to/from all aggregate tables
+        connection can be a SQLAlchemy connection or session, the caller commits
+        subtracting has to happen before the citations are deleted
+    """
+    pmids = [int(pmid) for pmid in pmids]
+    if not pmids:
+        return
+    for table, keys, columns, select in AGGREGATES:
+        # the filter is applied to the table that carries fk_pmid (the alias m for the joined MeSH table)
+        if table == "tbl_mesh_year_count":
+            filter = "m.fk_pmid = ANY(:pmids)"
+        else:
+            filter = "fk_pmid = ANY(:pmids)"
+        connection.execute(text(_upsert_statement(table, keys, columns, select, filter, sign)), {"pmids": pmids})
+        if sign < 0:
+            connection.execute(text("DELETE FROM %s.%s WHERE publications <= 0;" % (SCHEMA, table)))
+
+
+def add(connection, pmids):
+    update(connection, pmids, 1)
+
+
+def subtract(connection, pmids):
+    update(connection, pmids, -1)
+
+
+def rebuild(db_engine):
+    """
+        truncate all aggregate tables and count all citations of the database again
+    """
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    try:
+        for table, keys, columns, select in AGGREGATES:
+            connection.execute("TRUNCATE %s.%s;" % (SCHEMA, table))
+            connection.execute(_upsert_statement(table, keys, columns, select, "TRUE", 1))
+        transaction.commit()
+    except:
+        transaction.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser()
+    parser.add_option("-d", "--database",
+                      dest="database", default="pancreatic_cancer_db",
+                      help="What is the name of the database. (Default: pancreatic_cancer_db)")
+
+    (options, args) = parser.parse_args()
+
+    db_engine, base = PubMedDB.init(options.database)
+    rebuild(db_engine)
+    print "aggregate tables rebuilt:", ", ".join([aggregate[0] for aggregate in AGGREGATES])
@@ -16,6 +16,8 @@ import warnings
 import time
 
 import PubMedDB
+import PubMedAggregates
+import PubMedWorkload
 from sqlalchemy.orm import *
 from sqlalchemy.exc import *
 import gzip
@@ -25,6 +27,12 @@ from multiprocessing import Pool
 WARNING_LEVEL = "always"  # error, ignore, always, default, module, once
 # multiple processes, #processors-1 is optimal!
 PROCESSES = 4
+# fill the denormalized table tbl_citation_summary while parsing (set with option -m)
+CITATION_SUMMARY = False
+# update the aggregate tables (PubMedAggregates.py) for inserted and deleted citations (set with option -a)
+AGGREGATES = False
+# delete the citations listed in DeleteCitation elements of MEDLINE update files (set with option -x)
+DELETE_CITATIONS = False
 
 warnings.simplefilter(WARNING_LEVEL)
 
@@ -74,10 +82,13 @@ class FilePreloadScreener:
 class MedlineParser:
 
     # db is a global variable and given to MedlineParser(path,db) in _start_parser(path)
-    def __init__(self, filepath, db_name_input='pubmed'):  # TODO make way to pass db name as well
+    def __init__(self, filepath, db_name_input='pubmed', citation_summary=False, aggregates=False, delete_citations=False):  # TODO make way to pass db name as well
         db_engine, base = PubMedDB.init(db_name_input)
 
         self.filepath = filepath
+        self.citation_summary = citation_summary
+        self.aggregates = aggregates
+        self.delete_citations = delete_citations
         self.connection = db_engine.connect()
 
         Session = sessionmaker(bind=db_engine)
@@ -90,6 +101,8 @@ class MedlineParser:
         self.session.flush()
         self.session.close()
         self.connection.close()
+        # pool processes do not run atexit, so the recorded workload (PUBMED_WORKLOAD_LOG) is written per file
+        PubMedWorkload.flush()
 
     @staticmethod
     def _limited_string(input_str, limit):
@@ -105,6 +118,78 @@ class MedlineParser:
             return output_str.lower()
         return output_str
 
+    @staticmethod
+    def _citation_summary(db_citation, db_journal):
+        """
+            build the row of tbl_citation_summary from the already parsed child objects of a citation
+        """
+        db_summary = PubMedDB.CitationSummary()
+
+        try:
+            db_summary.pub_date_year = int(db_journal.pub_date_year)
+        except (TypeError, ValueError):
+            db_summary.pub_date_year = None
+
+        if db_citation.journal_infos:
+            db_summary.nlm_unique_id = db_citation.journal_infos[0].nlm_unique_id
+
+        descriptor_uis = [PubMedDB.mesh_ui_to_int(mesh.descriptor_ui) for mesh in db_citation.meshheadings]
+        db_summary.descriptor_uis = sorted(set([ui for ui in descriptor_uis if ui is not None]))
+        substance_uis = [PubMedDB.mesh_ui_to_int(chemical.substance_ui) for chemical in db_citation.chemicals]
+        db_summary.substance_uis = sorted(set([ui for ui in substance_uis if ui is not None]))
+        db_summary.keywords = [keyword.keyword for keyword in db_citation.keywords]
+
+        return db_summary
+
+    def _delete_citations(self, pmids):
+        """
+            delete citations listed in a DeleteCitation element of a MEDLINE update file
+            all other tables are cleaned up by the ON DELETE CASCADE foreign keys
+        """
+        existing_pmids = [row[0] for row in self.session
+            .query(PubMedDB.Citation.pmid)
+            .filter(PubMedDB.Citation.pmid.in_(pmids))
+            .all()]
+        if not existing_pmids:
+            return
+
+        if self.aggregates:
+            PubMedAggregates.subtract(self.session, existing_pmids)
+        self.session.query(PubMedDB.Citation)\
+            .filter(PubMedDB.Citation.pmid.in_(existing_pmids))\
+            .delete(synchronize_session=False)
+        PubMedDB.log_changes(self.session, existing_pmids, 'D')
+        self.session.commit()
+        print "Deleted %d citations listed in DeleteCitation [%s]" % (len(existing_pmids), self.filepath)
+
+    def _article_ids(self, pubmed_id, article_id_list):
+        """
+            insert the DOI, PMC-ID, PII, ... of the ArticleIdList of PubmedData for an already committed citation
+        """
+        if article_id_list is None:
+            return
+
+        article_ids = set()
+        for article_id in article_id_list.findall("ArticleId"):
+            article_id_type = article_id.attrib.get("IdType")
+            # the PubMed-ID itself is already stored in tbl_medline_citation
+            if not article_id.text or not article_id_type or article_id_type == "pubmed":
+                continue
+            article_ids.add((article_id_type, self._limited_string(article_id.text.strip(), 200)))
+
+        try:
+            for article_id_type, article_id in article_ids:
+                db_article_id = PubMedDB.ArticleID()
+                db_article_id.fk_pmid = pubmed_id
+                db_article_id.article_id_type = article_id_type
+                db_article_id.article_id = article_id
+                self.session.add(db_article_id)
+            self.session.commit()
+        except Exception as error:
+            error_str = unicode(str(error).encode('string_escape')).encode('UTF-8')
+            warnings.warn("\nArticleIdError: %s, %s, %s" % (self.filepath, pubmed_id, error_str), Warning)
+            self.session.rollback()
+
     def _parse(self):
         _file = self.filepath
 
@@ -127,12 +212,14 @@ class MedlineParser:
         db_xml_file.time_processed = datetime.datetime.now()  # time.localtime()
 
         loop_counter = 0  # to check for memory usage each X loops
+        last_pmid = None  # PubMed-ID of the last inserted citation, used for the following PubmedData element
 
         for event, elem in context:
 
             if event == "end":
                 if elem.tag == "MedlineCitation" or elem.tag == "BookDocument":
                     loop_counter += 1
+                    last_pmid = None
 
                     # catch KeyError in case there is no Owner or Status attribute before committing DBCitation
                     try:
@@ -180,13 +267,22 @@ class MedlineParser:
                             self.session.commit()
                             continue
                         else:
+                            if self.citation_summary:
+                                DBCitation.summaries = [self._citation_summary(DBCitation, db_journal)]
                             DBCitation.xml_files = [db_xml_file]  # adds an implicit add()
                             self.session.add(DBCitation)
+                            # the full text index is updated incrementally from the change log
+                            PubMedDB.log_changes(self.session, [pubmed_id], 'I')
+                            # counted in the same transaction as the citation, an aborted run leaves no uncounted citations
+                            if self.aggregates:
+                                self.session.flush()
+                                PubMedAggregates.add(self.session, [pubmed_id])
 
                         # if loop_counter % 100 == 0:
                         # Minimize losses on error/rollback
                         # TODO use larger commit block size once we're got all data problems licked
                         self.session.commit()
+                        last_pmid = pubmed_id
 
                     except IntegrityError as error:
                         error_str = unicode(str(error).encode('string_escape')).encode('UTF-8')
@@ -202,6 +298,20 @@ class MedlineParser:
                     db_journal = PubMedDB.Journal()
                     elem.clear()
 
+                # PubmedData (PubmedBookData) follows MedlineCitation (BookDocument), so the citation is already committed
+                # only the direct child ArticleIdList belongs to the citation, References contain ArticleIdLists as well
+                if elem.tag == "PubmedData" or elem.tag == "PubmedBookData":
+                    if last_pmid is not None:
+                        self._article_ids(last_pmid, elem.find("ArticleIdList"))
+                        last_pmid = None
+                    elem.clear()
+
+                # MEDLINE update files list citations that have to be removed from the database
+                if elem.tag == "DeleteCitation":
+                    if self.delete_citations:
+                        self._delete_citations([int(pmid.text) for pmid in elem.findall("PMID")])
+                    elem.clear()
+
                 # Kersten: some dates are given in 3-letter code - use dictionary month_code for conversion to digits:
                 if elem.tag == "DateCreated":
                     try:
@@ -650,7 +760,8 @@ def _start_parser(path):
     print path, '\tpid:', os.getpid()
 
     # Funky locking because we're going multiprocess
-    with MedlineParser(path) as p:
+    with MedlineParser(path, citation_summary=CITATION_SUMMARY, aggregates=AGGREGATES,
+                      delete_citations=DELETE_CITATIONS) as p:
         p._parse()
 
     return path
@@ -706,7 +817,8 @@ class ParserOrchestrator:
 
             from contextlib import closing
 
-            with closing(Pool(processes=PROCESSES)) as pool:
+            # the processes must not write the statements recorded by this process to the workload log again
+            with closing(Pool(processes=PROCESSES, initializer=PubMedWorkload.reset)) as pool:
                 print "Running multi-process with %d processes" % (PROCESSES,)
                 result = pool.map_async(_start_parser, paths[start:end])
                 res = result.get()
@@ -744,9 +856,21 @@ if __name__ == "__main__":
     parser.add_option("-d", "--database",
                       dest="database", default="pancreatic_cancer_db",
                       help="What is the name of the database. (Default: pancreatic_cancer_db)")
+    parser.add_option("-m", "--citation_summary",
+                      dest="citation_summary", action="store_true", default=False,
+                      help="Fill the denormalized table tbl_citation_summary (MeSH, chemical, and keyword arrays) while parsing. (Default: False)")
+    parser.add_option("-a", "--aggregates",
+                      dest="aggregates", action="store_true", default=False,
+                      help="Update the aggregate tables (publications per author, year, journal, country, MeSH term and year) for all inserted citations and for the citations deleted with option -x. (Default: False)")
+    parser.add_option("-x", "--delete_citations",
+                      dest="delete_citations", action="store_true", default=False,
+                      help="Delete the citations listed in DeleteCitation elements of MEDLINE update files from the database. (Default: False)")
 
     (options, args) = parser.parse_args()
     db_name = options.database
+    CITATION_SUMMARY = options.citation_summary
+    AGGREGATES = options.aggregates
+    DELETE_CITATIONS = options.delete_citations
     # log start time of programme:
     start = time.asctime()
 
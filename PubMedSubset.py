@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+    Copyright (c) 2014, Bjoern Gruening <bjoern.gruening@gmail.com>, Kersten Doering <kersten.doering@gmail.com>
+
+    This script registers a named list of PubMed-IDs (e.g. data/pubmed_result.txt) in a database that contains
+    a large PubMed data set and exposes it as a PostgreSQL schema with the same name. The schema contains one view
+    for every table of the schema pubmed (defined in PubMedDB.py), filtered to the PubMed-IDs of the list, and
+    views with the aggregates of PubMedAggregates.py. With option -m, materialized views are created instead.
+    All scripts that provide the parameter "-u" can query such a subset instead of the schema pubmed, e.g.:
+    python PubMedSubset.py -d pubmed -n pancreatic_cancer -i data/pubmed_result.txt
+    python full_text_index/find_authors.py -d pubmed -u pancreatic_cancer
+"""
+
+import re
+import datetime
+from cStringIO import StringIO
+
+import PubMedDB
+import PubMedAggregates
+
+
+SCHEMA = PubMedDB.SCHEMA
+
+# subset names are used as schema names without quoting
+NAME_PATTERN = re.compile(r"^[a-z_][a-z0-9_]{0,62}$")
+RESERVED_NAMES = ["public", "information_schema", SCHEMA]
+
+# tables of the schema pubmed that are not copied to a subset schema
+SUBSET_TABLES = [PubMedDB.Subset.__tablename__, PubMedDB.SubsetPMID.__tablename__]
+AGGREGATE_TABLES = [aggregate[0] for aggregate in PubMedAggregates.AGGREGATES]
+
+
+def check_name(name):
+    if not NAME_PATTERN.match(name) or name in RESERVED_NAMES or name.startswith("pg_"):
+        raise ValueError("invalid subset name '%s' - use lowercase letters, digits, and underscores" % (name,))
+    return name
+
+
+def read_pmids(path):
+    """
+        read PubMed-IDs from a file with one PubMed-ID per line (only the first tab-separated column is used,
+        so results files of RunXapian.py work as well)
+    """
+    pmids = set()
+    infile = open(path, "r")
+    for line in infile:
+        pmid = line.strip().split("\t")[0]
+        if pmid.isdigit():
+            pmids.add(int(pmid))
+    infile.close()
+    return sorted(pmids)
+
+
+def _view_statements(name, materialized):
+    """
+        generate the CREATE statements for all views of a subset schema
+    """
+    view = "MATERIALIZED VIEW" if materialized else "VIEW"
+    subset_pmids = "SELECT fk_pmid FROM %s.%s WHERE subset_name = '%s'" % (SCHEMA, PubMedDB.SubsetPMID.__tablename__, name)
+
+    statements = []
+    for table in PubMedDB.Base.metadata.sorted_tables:
+        if table.schema != SCHEMA or table.name in SUBSET_TABLES + AGGREGATE_TABLES:
+            continue
+        columns = table.columns.keys()
+        if "fk_pmid" in columns:
+            pmid_column = "fk_pmid"
+            condition = "t.fk_pmid IN (%s)" % (subset_pmids,)
+        elif "pmid" in columns:
+            pmid_column = "pmid"
+            condition = "t.pmid IN (%s)" % (subset_pmids,)
+        elif table.name == PubMedDB.XMLFile.__tablename__:
+            pmid_column = None
+            condition = "(t.id, t.xml_file_name) IN (SELECT id_file, xml_file_name FROM %s.%s WHERE fk_pmid IN (%s))" \
+                % (SCHEMA, PubMedDB.PMID_File_Mapping.__tablename__, subset_pmids)
+        else:
+            continue
+        statements.append("CREATE %s %s.%s AS SELECT t.* FROM %s.%s t WHERE %s;"
+                          % (view, name, table.name, SCHEMA, table.name, condition))
+        if materialized and pmid_column:
+            statements.append("CREATE INDEX ON %s.%s (%s);" % (name, table.name, pmid_column))
+
+    # the aggregates are computed from the views of the subset
+    for table, keys, columns, select in PubMedAggregates.AGGREGATES:
+        statements.append("CREATE %s %s.%s (%s) AS %s;"
+                          % (view, name, table, ", ".join(columns), PubMedAggregates.select_statement(select, name)))
+
+    return statements
+
+
+def create(db_engine, name, pmids, materialized=False, source=None):
+    """
+        register the list of PubMed-IDs under the given name and (re)create the schema with its views
+    """
+    check_name(name)
+    connection = db_engine.raw_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DROP SCHEMA IF EXISTS %s CASCADE;" % (name,))
+        cursor.execute("DELETE FROM %s.%s WHERE name = %%s;" % (SCHEMA, PubMedDB.Subset.__tablename__), (name,))
+        cursor.execute("INSERT INTO %s.%s (name, materialized, source, time_created) VALUES (%%s, %%s, %%s, %%s);"
+                       % (SCHEMA, PubMedDB.Subset.__tablename__),
+                       (name, materialized, source, datetime.datetime.now()))
+
+        # COPY is much faster than one INSERT per PubMed-ID
+        rows = StringIO("".join(["%s\t%d\n" % (name, pmid) for pmid in pmids]))
+        cursor.copy_expert("COPY %s.%s (subset_name, fk_pmid) FROM STDIN;" % (SCHEMA, PubMedDB.SubsetPMID.__tablename__), rows)
+
+        cursor.execute("CREATE SCHEMA %s;" % (name,))
+        for stmt in _view_statements(name, materialized):
+            cursor.execute(stmt)
+
+        cursor.execute("SELECT count(*) FROM %s.%s;" % (name, PubMedDB.Citation.__tablename__))
+        found = cursor.fetchone()[0]
+        connection.commit()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+    return found
+
+
+def refresh(db_engine, name):
+    """
+        refresh the materialized views of a subset, e.g. after new XML files were parsed
+    """
+    check_name(name)
+    connection = db_engine.raw_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT matviewname FROM pg_matviews WHERE schemaname = %s;", (name,))
+        views = set([row[0] for row in cursor.fetchall()])
+        # base tables first, the aggregates are computed from them
+        for table in [table.name for table in PubMedDB.Base.metadata.sorted_tables] + AGGREGATE_TABLES:
+            if table in views:
+                cursor.execute("REFRESH MATERIALIZED VIEW %s.%s;" % (name, table))
+        connection.commit()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def drop(db_engine, name):
+    check_name(name)
+    connection = db_engine.raw_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DROP SCHEMA IF EXISTS %s CASCADE;" % (name,))
+        cursor.execute("DELETE FROM %s.%s WHERE name = %%s;" % (SCHEMA, PubMedDB.Subset.__tablename__), (name,))
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def list_subsets(db_engine):
+    stmt = """
+        SELECT
+            s.name, s.materialized, s.source, s.time_created, count(p.fk_pmid)
+        FROM
+            %(schema)s.tbl_subset s
+                LEFT OUTER JOIN
+            %(schema)s.tbl_subset_pmid p
+                    ON p.subset_name = s.name
+        GROUP BY
+            s.name, s.materialized, s.source, s.time_created
+        ORDER BY
+            s.name
+        ;
+    """ % {"schema": SCHEMA}
+    return db_engine.execute(stmt).fetchall()
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+    import sys
+
+    parser = OptionParser()
+    parser.add_option("-d", "--database",
+                      dest="database", default="pancreatic_cancer_db",
+                      help="What is the name of the database. (Default: pancreatic_cancer_db)")
+    parser.add_option("-n", "--name",
+                      dest="name", default=None,
+                      help="Name of the subset, which is also the name of the schema with its views.")
+    parser.add_option("-i", "--input",
+                      dest="input", default=None,
+                      help="File with one PubMed-ID per line, e.g. data/pubmed_result.txt. Creates or replaces the subset.")
+    parser.add_option("-m", "--materialize",
+                      dest="materialize", action="store_true", default=False,
+                      help="Create materialized views with an index on the PubMed-ID instead of plain views. (Default: False)")
+    parser.add_option("-f", "--refresh",
+                      dest="refresh", action="store_true", default=False,
+                      help="Refresh the materialized views of the subset. (Default: False)")
+    parser.add_option("-r", "--remove",
+                      dest="remove", action="store_true", default=False,
+                      help="Remove the subset and its schema. (Default: False)")
+    parser.add_option("-l", "--list",
+                      dest="list", action="store_true", default=False,
+                      help="List all registered subsets. (Default: False)")
+
+    (options, args) = parser.parse_args()
+
+    db_engine, base = PubMedDB.init(options.database)
+
+    if options.list:
+        for name, materialized, source, time_created, pmids in list_subsets(db_engine):
+            print "%s\t%d PubMed-IDs\t%s\t%s\t%s" % (name, pmids, "materialized" if materialized else "views", source, time_created)
+        sys.exit(0)
+
+    if not options.name:
+        parser.print_help()
+        sys.exit("no subset name given - programme terminates")
+
+    if options.remove:
+        drop(db_engine, options.name)
+        print "subset %s removed" % (options.name,)
+    elif options.input:
+        pmids = read_pmids(options.input)
+        found = create(db_engine, options.name, pmids, options.materialize, options.input)
+        print "subset %s created with %d PubMed-IDs, %d of them are in the database" % (options.name, len(pmids), found)
+    elif options.refresh:
+        refresh(db_engine, options.name)
+        print "subset %s refreshed" % (options.name,)
+    else:
+        parser.print_help()
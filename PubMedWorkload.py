@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+    Copyright (c) 2014, Bjoern Gruening <bjoern.gruening@gmail.com>, Kersten Doering <kersten.doering@gmail.com>
+
+    This script records the SQL workload on a pubmed database, reports the slowest query shapes, and proposes
+    indexes for predicates that are not covered by the indexes defined in PubMedDB.py.
+
+    Statements are captured in two ways:
+    - a SQLAlchemy event hook: set the environment variable PUBMED_WORKLOAD_LOG to a file name and every engine
+      created by PubMedDB.init() appends its statements (normalized, with number of calls and run times) to it
+    - the PostgreSQL extension pg_stat_statements (option -g), which also covers the psycopg2 scripts
+
+    Proposed indexes can be benchmarked with option -b: each recorded example query (SELECT or WITH) is run before and
+    after creating the index inside a transaction that is rolled back afterwards (use -k to keep the indexes, the
+    examples are always rolled back), so this should be done on a sample database.
+"""
+
+import os
+import re
+import sys
+import time
+import json
+import fcntl
+import atexit
+
+from sqlalchemy import event
+
+import PubMedDB
+
+
+SCHEMA = PubMedDB.SCHEMA
+
+# write the recorded shapes to the log file after this number of statements (and with flush() or at exit)
+FLUSH_EVERY = 1000
+
+# recorded statistics of this process: shape -> {"calls", "total", "max", "example"}
+WORKLOAD = {}
+_pending = [0]
+# log file of this process, set by record()
+_path = [None]
+
+
+def normalize(statement):
+    """
+        reduce a statement to its shape: literals, bind parameters, and value lists become "?"
+    """
+    shape = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    shape = re.sub(r"%\(\w+\)s|%s|\$\d+|:\w+", "?", shape)
+    shape = re.sub(r"\b\d+(?:\.\d+)?\b", "?", shape)
+    shape = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", shape)
+    shape = re.sub(r"ARRAY\[[^\]]*\]", "ARRAY[?]", shape)
+    return re.sub(r"\s+", " ", shape).strip()
+
+
+def _add(workload, shape, calls, total, maximum, example):
+    stats = workload.setdefault(shape, {"calls": 0, "total": 0.0, "max": 0.0, "example": None})
+    stats["calls"] += calls
+    stats["total"] += total
+    stats["max"] = max(stats["max"], maximum)
+    if stats["example"] is None:
+        stats["example"] = example
+
+
+def _flush(path):
+    if not WORKLOAD:
+        return
+    outfile = open(path, "a")
+    # several parser processes may write to the same log file
+    fcntl.flock(outfile, fcntl.LOCK_EX)
+    for shape, stats in WORKLOAD.items():
+        outfile.write(json.dumps({"shape": shape, "calls": stats["calls"], "total": stats["total"],
+                                  "max": stats["max"], "example": stats["example"]}) + "\n")
+    fcntl.flock(outfile, fcntl.LOCK_UN)
+    outfile.close()
+    WORKLOAD.clear()
+    _pending[0] = 0
+
+
+def flush():
+    """
+        write the statements recorded so far to the log file (nothing happens if no engine is recorded)
+        processes of a multiprocessing pool end without running atexit, so they have to flush themselves
+    """
+    if _path[0] is not None:
+        _flush(_path[0])
+
+
+def reset():
+    """
+        forget the unwritten statements inherited from the parent process, initializer of multiprocessing pools
+    """
+    WORKLOAD.clear()
+    _pending[0] = 0
+
+
+def record(engine, path):
+    """
+        attach the event hooks to a SQLAlchemy engine, statements are written to path
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("workload_start", []).append(time.time())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.time() - conn.info["workload_start"].pop()
+        shape = normalize(statement)
+        example = None
+        if shape not in WORKLOAD and not executemany:
+            try:
+                example = cursor.mogrify(statement, parameters)
+            except Exception:
+                example = None
+        _add(WORKLOAD, shape, 1, duration, duration, example)
+        _pending[0] += 1
+        if _pending[0] >= FLUSH_EVERY:
+            _flush(path)
+
+    if _path[0] != path:
+        _path[0] = path
+        atexit.register(_flush, path)
+    return engine
+
+
+def read_log(path):
+    """
+        merge the entries of a workload log file by shape
+    """
+    workload = {}
+    for line in open(path, "r"):
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        _add(workload, entry["shape"], entry["calls"], entry["total"], entry["max"], entry["example"])
+    return workload
+
+
+def read_pg_stat_statements(db_engine, limit=100):
+    """
+        read the slowest statements of the current database from pg_stat_statements
+        (times are converted from milliseconds to seconds, examples are not available)
+    """
+    columns = [row[0] for row in db_engine.execute(
+        "SELECT attname FROM pg_attribute WHERE attrelid = 'pg_stat_statements'::regclass;")]
+    # PostgreSQL 13 renamed the timing columns
+    if "total_exec_time" in columns:
+        total, maximum = "total_exec_time", "max_exec_time"
+    else:
+        total, maximum = "total_time", "max_time"
+    stmt = """
+        SELECT
+            query, calls, %(total)s, %(max)s
+        FROM
+            pg_stat_statements
+        WHERE
+            dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+        ORDER BY
+            %(total)s DESC
+        LIMIT %(limit)d
+        ;
+    """ % {"total": total, "max": maximum, "limit": int(limit)}
+    workload = {}
+    for query, calls, total_time, max_time in db_engine.execute(stmt):
+        _add(workload, normalize(query), calls, total_time / 1000.0, max_time / 1000.0, None)
+    return workload
+
+
+def slowest(workload, limit=20):
+    return sorted(workload.items(), key=lambda item: item[1]["total"], reverse=True)[:limit]
+
+
+# FROM/JOIN <schema>.<table> [AS] <alias>
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+(?:(\w+)\.)?(\w+)(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|LEFT|RIGHT|INNER|OUTER|FULL|CROSS|JOIN|GROUP|ORDER|LIMIT|USING|UNION)\b)(\w+))?", re.IGNORECASE)
+# [<qualifier>.]<column> <operator> and lower(<column>) <operator>
+_PREDICATE_PATTERN = re.compile(r"(lower\(\s*)?\b(?:(\w+)\.)?(\w+)\s*\)?\s*(?:=|<>|!=|<=|>=|<|>|\bIN\b|\bBETWEEN\b)", re.IGNORECASE)
+# = <qualifier>.<column> (right-hand side of join conditions)
+_JOIN_PATTERN = re.compile(r"=\s*(\w+)\.(\w+)\b(?!\s*\()")
+
+
+def _model_tables():
+    tables = {}
+    for table in PubMedDB.Base.metadata.sorted_tables:
+        if table.schema == SCHEMA:
+            tables[table.name] = table
+    return tables
+
+
+def _covered_columns(table):
+    """
+        columns that are the leading column of an index or of the primary key
+    """
+    covered = set()
+    for index in table.indexes:
+        columns = list(index.columns)
+        if columns:
+            covered.add(columns[0].name)
+    primary_key = list(table.primary_key.columns)
+    if primary_key:
+        covered.add(primary_key[0].name)
+    return covered
+
+
+def predicates(statement, tables=None):
+    """
+        return the set of (table, column, is_lower) used in comparisons of a statement, restricted to the models
+    """
+    if tables is None:
+        tables = _model_tables()
+
+    aliases = {}
+    used_tables = []
+    for schema, name, alias in _TABLE_PATTERN.findall(statement):
+        if name in tables:
+            used_tables.append(name)
+            aliases[name] = name
+            if alias:
+                aliases[alias] = name
+
+    found = set()
+    candidates = [(lower, qualifier, column) for lower, qualifier, column in _PREDICATE_PATTERN.findall(statement)]
+    candidates += [("", qualifier, column) for qualifier, column in _JOIN_PATTERN.findall(statement)]
+    for lower, qualifier, column in candidates:
+        if qualifier:
+            table = aliases.get(qualifier)
+        else:
+            # unqualified columns belong to the only used table that has them
+            owners = [name for name in set(used_tables) if column in tables[name].columns]
+            table = owners[0] if len(owners) == 1 else None
+        if table and column in tables[table].columns:
+            found.add((table, column, bool(lower)))
+    return found
+
+
+def propose_indexes(workload):
+    """
+        propose indexes for predicates on columns without index, ordered by the total time of the statements
+        returns a list of dictionaries with "sql", "table", "total", "calls", and "examples"
+    """
+    tables = _model_tables()
+    proposals = {}
+    for shape, stats in workload.items():
+        for table, column, lower in predicates(shape, tables):
+            if not lower and column in _covered_columns(tables[table]):
+                continue
+            expression = "lower(%s)" % (column,) if lower else column
+            name = "ix_%s_%s%s" % (table.replace("tbl_", "", 1), "lower_" if lower else "", column)
+            sql = "CREATE INDEX %s ON %s.%s (%s);" % (name[:63], SCHEMA, table, expression)
+            proposal = proposals.setdefault(sql, {"sql": sql, "table": table, "total": 0.0, "calls": 0, "examples": []})
+            proposal["total"] += stats["total"]
+            proposal["calls"] += stats["calls"]
+            if stats["example"]:
+                proposal["examples"].append(stats["example"])
+    return sorted(proposals.values(), key=lambda proposal: proposal["total"], reverse=True)
+
+
+# statements that are benchmarked, the recorded INSERT, UPDATE, and DELETE statements of the parser are skipped
+_QUERY_PATTERN = re.compile(r"^\s*(?:SELECT|WITH)\b", re.IGNORECASE)
+
+
+def _run_time(cursor, statement, repeat):
+    best = None
+    for i in range(repeat):
+        # a WITH query may modify rows as well, so every run is rolled back (also with -k)
+        cursor.execute("SAVEPOINT workload_example;")
+        start = time.time()
+        cursor.execute(statement)
+        if cursor.description is not None:
+            cursor.fetchall()
+        duration = time.time() - start
+        cursor.execute("ROLLBACK TO SAVEPOINT workload_example;")
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def benchmark(db_engine, proposal, repeat=3, keep=False):
+    """
+        run the example queries of a proposal before and after creating the index (best of repeat runs)
+        returns a list of (example, seconds before, seconds after)
+    """
+    connection = db_engine.raw_connection()
+    cursor = connection.cursor()
+    results = []
+    try:
+        examples = [example for example in proposal["examples"] if _QUERY_PATTERN.match(example)][:5]
+        before = [_run_time(cursor, example, repeat) for example in examples]
+        cursor.execute(proposal["sql"])
+        cursor.execute("ANALYZE %s.%s;" % (SCHEMA, proposal["table"]))
+        after = [_run_time(cursor, example, repeat) for example in examples]
+        results = zip(examples, before, after)
+        if keep:
+            connection.commit()
+        else:
+            connection.rollback()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+    return results
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser()
+    parser.add_option("-d", "--database",
+                      dest="database", default="pancreatic_cancer_db",
+                      help="What is the name of the database. (Default: pancreatic_cancer_db)")
+    parser.add_option("-w", "--workload_log",
+                      dest="workload_log", default=os.environ.get("PUBMED_WORKLOAD_LOG"),
+                      help="Workload log file written by the SQLAlchemy hook. (Default: $PUBMED_WORKLOAD_LOG)")
+    parser.add_option("-g", "--pg_stat_statements",
+                      dest="pg_stat_statements", action="store_true", default=False,
+                      help="Read the workload from pg_stat_statements instead of the log file. (Default: False)")
+    parser.add_option("-n", "--number",
+                      dest="number", default=20,
+                      help="Number of query shapes and index proposals to report. (Default: 20)")
+    parser.add_option("-b", "--benchmark",
+                      dest="benchmark", action="store_true", default=False,
+                      help="Benchmark the proposed indexes with the recorded example queries (SELECT or WITH). (Default: False)")
+    parser.add_option("-k", "--keep",
+                      dest="keep", action="store_true", default=False,
+                      help="Keep the benchmarked indexes instead of rolling them back. (Default: False)")
+
+    (options, args) = parser.parse_args()
+    number = int(options.number)
+
+    db_engine, base = PubMedDB.init(options.database)
+
+    if options.pg_stat_statements:
+        workload = read_pg_stat_statements(db_engine)
+    elif options.workload_log and os.path.isfile(options.workload_log):
+        workload = read_log(options.workload_log)
+    else:
+        parser.print_help()
+        sys.exit("no workload log file given and pg_stat_statements not selected - programme terminates")
+
+    print "### slowest query shapes ###"
+    print "total [s]\tcalls\tmean [ms]\tmax [ms]\tshape"
+    for shape, stats in slowest(workload, number):
+        print "%.3f\t%d\t%.2f\t%.2f\t%s" % (stats["total"], stats["calls"], 1000.0 * stats["total"] / max(stats["calls"], 1),
+                                           1000.0 * stats["max"], shape[0:300])
+
+    print "\n### proposed indexes ###"
+    proposals = propose_indexes(workload)[:number]
+    if not proposals:
+        print "all predicates are covered by indexes"
+    for proposal in proposals:
+        print "%s\t-- %.3f s in %d calls" % (proposal["sql"], proposal["total"], proposal["calls"])
+        if options.benchmark:
+            results = benchmark(db_engine, proposal, keep=options.keep)
+            if not results:
+                print "\tno example query recorded"
+            for example, before, after in results:
+                print "\t%.2f ms -> %.2f ms\t%s" % (1000.0 * before, 1000.0 * after, " ".join(example.split())[0:200])
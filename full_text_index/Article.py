@@ -4,7 +4,6 @@
     Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
 """
 
-import xappy
 import sys
 
 from sqlalchemy import *
@@ -13,13 +12,21 @@ from sqlalchemy.orm import sessionmaker
 
 from SynonymParser import SynonymParser
 
-class Article():
+#fields of the boolean filter terms in the index (see PubMedXapian.filterQuery)
+FILTER_FIELDS = ("mesh_ui", "chemical_ui", "issn", "nlm_id", "publication_type", "language", "author")
+
+class Article(object):
     
+    #articles are streamed one by one into the indexer, so keep the instances small
+    __slots__     = ("__pmid", "__title", "__abstract", "__chemicals", "__keywords", "__mesh", "__year", "__journal", "__country", "__filterTerms")
+
     user          = "parser"
     password      = "parser"
     host          = "localhost"
     port          = "5432"
     db            = ""
+    #schema of the tables, set to the name of a subset created with PubMedSubset.py to index only this subset
+    schema        = "pubmed"
     con           = "postgresql://"+user+":"+password+"@"+host+":"+port+"/"
 
     #Kersten: set these attributes when calling static function getConnection(database)
@@ -28,34 +35,57 @@ class Article():
     base          = None#__base.metadata.create_all(__engine)
     session       = None#sessionmaker(bind=__engine)()    
 
+    #number of rows fetched at once from the server-side cursor of the bulk loader
+    batchSize     = 1000
+
     __count         = 0
     __countMsg      = ""
 
     def __init__(
                  self,
-                 pmid
+                 pmid,
+                 title     = None,
+                 abstract  = None,
+                 chemicals = None,
+                 keywords  = None,
+                 mesh      = None,
+                 year      = None,
+                 journal   = None,
+                 country   = None,
+                 filterTerms = None,
+                 load      = True
                  ):
 
         self.__pmid     = int(pmid)
-        self.__title    = None
-        self.__abstract = None
-        self.__chemicals= []
-        self.__keywords = []
-        self.__mesh     = []
-        
-        self.__loadStub()
-        self.__loadChemicals()
-        self.__loadKeywords()
-        self.__loadMeSH()
+        self.__title    = title
+        self.__abstract = abstract
+        #stored as value slot / exact terms in the index for filtering by year, journal, and country
+        self.__year     = year
+        self.__journal  = journal
+        self.__country  = country
+        self.__chemicals= chemicals or []
+        self.__keywords = keywords or []
+        self.__mesh     = mesh or []
+        #identifiers and metadata indexed as boolean filter terms: field of FILTER_FIELDS -> list of values
+        self.__filterTerms = filterTerms or {}
+        
+        #the bulk loader passes all fields and sets load = False, otherwise each field needs its own query
+        if load:
+            self.__loadStub()
+            self.__loadChemicals()
+            self.__loadKeywords()
+            self.__loadMeSH()
     
-        Article.__count     += 1
-        nbs                 = len(Article.__countMsg)        
-        Article.__countMsg  = "article %s created" % (str(Article.__count))
-        sys.stdout.write('\b' * nbs + Article.__countMsg)
+            #articles of the bulk loader are counted by the indexer
+            Article.__count     += 1
+            nbs                 = len(Article.__countMsg)        
+            Article.__countMsg  = "article %s created" % (str(Article.__count))
+            sys.stdout.write('\b' * nbs + Article.__countMsg)
         
     @staticmethod
-    def getConnection(database):
+    def getConnection(database, schema = "pubmed"):
         
+        Article.schema        = schema
         Article.con           = "postgresql://"+Article.user+":"+Article.password+"@"+Article.host+":"+Article.port+"/"+database
         Article.base          = declarative_base()
         Article.engine        = create_engine(Article.con, pool_recycle = 900, echo=False)
@@ -71,6 +101,15 @@ class Article():
     
     def getAbstract(self):
         return self.__abstract
+
+    def getYear(self):
+        return self.__year
+
+    def getJournal(self):
+        return self.__journal
+
+    def getCountry(self):
+        return self.__country
     
     def getChemicals(self):
         return self.__chemicals
@@ -81,6 +120,9 @@ class Article():
     def getMeSH(self):
         return self.__mesh
 
+    def getFilterTerms(self):
+        return self.__filterTerms
+
     def __loadStub(self):
             pmid = str(self.__pmid)
             #print "####",pmid,"####"#in this case it is always one pmid - it is not a "complete" join
@@ -88,11 +130,13 @@ class Article():
             SELECT 
                 pmid,
                 article_title as title,
-                abstract_text as abstract
+                abstract_text as abstract,
+                """+Article.filterColumns("pmid")+""",
+                """+Article.filterTermColumns("pmid")+"""
             FROM 
-                pubmed.tbl_medline_citation
+                """+Article.schema+""".tbl_medline_citation
                     LEFT OUTER JOIN
-                pubmed.tbl_abstract
+                """+Article.schema+""".tbl_abstract
                         ON pmid = fk_pmid
             WHERE
                 pmid = '"""+pmid+"""'
@@ -102,12 +146,20 @@ class Article():
             articles = Article.session.query(
                     "pmid",
                     "title",
-                    "abstract"
+                    "abstract",
+                    "year",
+                    "journal",
+                    "country",
+                    *FILTER_FIELDS
             ).from_statement(stmt)
             
             for article in articles:
                 self.__title    = article.title
                 self.__abstract = article.abstract
+                self.__year     = article.year
+                self.__journal  = article.journal
+                self.__country  = article.country
+                self.__filterTerms = Article.filterTerms(article)
                 break;
 
     def __loadChemicals(self):
@@ -117,7 +169,7 @@ class Article():
             SELECT 
                 name_of_substance AS substance
             FROM 
-                pubmed.tbl_chemical
+                """+Article.schema+""".tbl_chemical
             WHERE
                 fk_pmid = '"""+pmid+"""'
             ORDER BY 
@@ -139,7 +191,7 @@ class Article():
             SELECT 
                 keyword
             FROM 
-                pubmed.tbl_keyword
+                """+Article.schema+""".tbl_keyword
             WHERE
                 fk_pmid = '"""+pmid+"""'
             ORDER BY 
@@ -161,7 +213,7 @@ class Article():
             SELECT 
                 descriptor_name
             FROM 
-                pubmed.tbl_mesh_heading
+                """+Article.schema+""".tbl_mesh_heading
             WHERE
                 fk_pmid = '"""+pmid+"""'
             ORDER BY 
@@ -177,31 +229,179 @@ class Article():
             self.__mesh.append(descriptor_name.descriptor_name)
 
     @staticmethod
-    def getArticlesByYear(b_year, e_year):
+    def filterColumns(pmid):
+        #publication year, journal (MEDLINE abbreviation), and country of the journal as columns year, journal, country
+        return """
+                (SELECT min(pub_date_year) FROM """+Article.schema+""".tbl_journal WHERE fk_pmid = """+pmid+""") AS year,
+                (SELECT medline_ta FROM """+Article.schema+""".tbl_medline_journal_info WHERE fk_pmid = """+pmid+""" LIMIT 1) AS journal,
+                (SELECT country FROM """+Article.schema+""".tbl_medline_journal_info WHERE fk_pmid = """+pmid+""" LIMIT 1) AS country"""
+
+    @staticmethod
+    def filterTermColumns(pmid):
+        #one array column per field of FILTER_FIELDS - author keys are "<last name> <initials>" in lowercase, e.g.
+        #"friess h" for "Friess, H" and "Friess, Helmut"
+        return """
+                ARRAY(SELECT DISTINCT descriptor_ui FROM """+Article.schema+""".tbl_mesh_heading WHERE fk_pmid = """+pmid+""" AND descriptor_ui IS NOT NULL) AS mesh_ui,
+                ARRAY(SELECT DISTINCT substance_ui FROM """+Article.schema+""".tbl_chemical WHERE fk_pmid = """+pmid+""" AND substance_ui IS NOT NULL) AS chemical_ui,
+                ARRAY(SELECT DISTINCT issn FROM """+Article.schema+""".tbl_journal WHERE fk_pmid = """+pmid+""" AND issn IS NOT NULL) AS issn,
+                ARRAY(SELECT DISTINCT nlm_unique_id FROM """+Article.schema+""".tbl_medline_journal_info WHERE fk_pmid = """+pmid+""" AND nlm_unique_id IS NOT NULL) AS nlm_id,
+                ARRAY(SELECT DISTINCT publication_type FROM """+Article.schema+""".tbl_publication_type WHERE fk_pmid = """+pmid+""") AS publication_type,
+                ARRAY(SELECT DISTINCT language FROM """+Article.schema+""".tbl_language WHERE fk_pmid = """+pmid+""") AS language,
+                ARRAY(SELECT DISTINCT lower(trim(last_name || ' ' || coalesce(initials, ''))) FROM """+Article.schema+""".tbl_author WHERE fk_pmid = """+pmid+""" AND last_name IS NOT NULL) AS author"""
+
+    @staticmethod
+    def filterTerms(row):
+        #values of the columns of filterTermColumns (CHAR columns are padded with spaces)
+        return dict([(field, [value.strip() for value in getattr(row, field) if value and value.strip()]) for field in FILTER_FIELDS])
+
+    @staticmethod
+    def __loadArticles(condition, batchSize = None):
+        #one query for title, abstract, chemicals, keywords, and MeSH terms of all selected articles instead of
+        #four queries per article - rows are streamed from a server-side cursor in batches of batchSize
+        stmt = """
+            SELECT 
+                pmc.pmid,
+                pmc.article_title AS title,
+                (SELECT abstract_text FROM """+Article.schema+""".tbl_abstract WHERE fk_pmid = pmc.pmid LIMIT 1) AS abstract,
+                """+Article.filterColumns("pmc.pmid")+""",
+                """+Article.filterTermColumns("pmc.pmid")+""",
+                ARRAY(SELECT name_of_substance FROM """+Article.schema+""".tbl_chemical WHERE fk_pmid = pmc.pmid ORDER BY name_of_substance) AS chemicals,
+                ARRAY(SELECT keyword FROM """+Article.schema+""".tbl_keyword WHERE fk_pmid = pmc.pmid ORDER BY keyword) AS keywords,
+                ARRAY(SELECT descriptor_name FROM """+Article.schema+""".tbl_mesh_heading WHERE fk_pmid = pmc.pmid ORDER BY descriptor_name) AS mesh
+            FROM 
+                """+Article.schema+""".tbl_medline_citation pmc
+            WHERE
+                """+condition+"""
+        ;
+        """
+
+        connection = Article.engine.connect().execution_options(stream_results=True)
+        try:
+            result = connection.execute(stmt)
+            while True:
+                rows = result.fetchmany(batchSize or Article.batchSize)
+                if not rows:
+                    break
+                for row in rows:
+                    yield Article(row.pmid, row.title, row.abstract, row.chemicals, row.keywords, row.mesh, row.year, row.journal, row.country, Article.filterTerms(row), load = False)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def __yearCondition(b_year, e_year):
         b_year            = int(b_year)
         e_year            = int(e_year)
         
         
+        condition = """
+                pmc.pmid IN (
+                    SELECT 
+                        fk_pmid 
+                    FROM 
+                        """+Article.schema+""".tbl_journal 
+                    WHERE 
+                        pub_date_year >= """+str(b_year)+""" 
+                            AND 
+                        pub_date_year <= """+str(e_year)+"""
+                )
+        """
+
+        return condition
+
+    @staticmethod
+    def iterArticlesByYear(b_year, e_year, batchSize = None, b_pmid = None, e_pmid = None):
+        #lazy iterator for PubMedXapian.buildIndexWithArticles - the connection stays open until it is exhausted
+        #b_pmid and e_pmid restrict the articles to a range of PubMed-IDs (one shard of a parallel index build)
+        condition = Article.__yearCondition(b_year, e_year)
+        if b_pmid != None:
+            condition += " AND pmc.pmid >= "+str(int(b_pmid))
+        if e_pmid != None:
+            condition += " AND pmc.pmid <= "+str(int(e_pmid))
+        return Article.__loadArticles(condition, batchSize)
+
+    @staticmethod
+    def getPMIDRanges(b_year, e_year, shards):
+        #split the PubMed-IDs of a range of years into (at most) shards consecutive ranges with the same number of
+        #articles - consecutive ranges keep the document IDs of the shards apart when they are merged
+        stmt = """
+            SELECT 
+                min(pmid) AS b_pmid,
+                max(pmid) AS e_pmid
+            FROM 
+                (
+                SELECT 
+                    pmc.pmid, 
+                    ntile("""+str(int(shards))+""") OVER (ORDER BY pmc.pmid) AS shard
+                FROM 
+                    """+Article.schema+""".tbl_medline_citation pmc
+                WHERE
+                    """+Article.__yearCondition(b_year, e_year)+"""
+                ) AS shards
+            GROUP BY 
+                shard
+            ORDER BY 
+                shard
+        ;
+        """
+        return [(row.b_pmid, row.e_pmid) for row in Article.engine.execute(stmt)]
+
+    @staticmethod
+    def getArticlesByYear(b_year, e_year, batchSize = None):
+        return list(Article.iterArticlesByYear(b_year, e_year, batchSize))
+
+    @staticmethod
+    def iterArticlesByPMIDs(pmids, b_year, e_year, batchSize = None):
+        #lazy iterator over the articles of a list of PubMed-IDs (in the range of years), used for incremental updates
+        pmids = sorted(set([int(pmid) for pmid in pmids]))
+        for i in range(0, len(pmids), 10000):
+            condition = Article.__yearCondition(b_year, e_year)
+            condition += " AND pmc.pmid IN ("+", ".join([str(pmid) for pmid in pmids[i:i + 10000]])+")"
+            for article in Article.__loadArticles(condition, batchSize):
+                yield article
+
+    @staticmethod
+    def getChangeWatermark():
+        #id of the last row in tbl_change_log (written by PubMedParser.py), 0 if there are no changes yet
+        stmt = "SELECT coalesce(max(id), 0) FROM "+Article.schema+".tbl_change_log;"
+        return int(Article.engine.execute(stmt).scalar())
+
+    @staticmethod
+    def getChanges(watermark):
+        #return the id of the last change after the watermark and the PubMed-IDs that were inserted or deleted since then
+        #only the last change of each PubMed-ID counts, e.g. a citation deleted and inserted again is "inserted"
         stmt = """
             SELECT 
-                pmc.fk_pmid
+                id,
+                fk_pmid,
+                change_type
             FROM 
-                pubmed.tbl_journal pmc
+                """+Article.schema+""".tbl_change_log
             WHERE
-                pub_date_year >= """+str(b_year)+"""
-                    AND
-                pub_date_year <= """+str(e_year)+"""
-           
+                id > """+str(int(watermark))+"""
+            ORDER BY 
+                id
         ;
-        """ 
+        """
 
-        pmids = Article.session.query(
-                    "fk_pmid"
-        ).from_statement(stmt)
-        return [Article(pmid.fk_pmid) for pmid in pmids]
+        last_id = int(watermark)
+        changes = {}
+        for row in Article.engine.execute(stmt):
+            last_id = row.id
+            changes[row.fk_pmid] = row.change_type
+        inserted = sorted([pmid for pmid, change_type in changes.items() if change_type == 'I'])
+        deleted = sorted([pmid for pmid, change_type in changes.items() if change_type == 'D'])
+        return last_id, inserted, deleted
+
+    @staticmethod
+    def getArticlesByPMIDRange(b_pmid, e_pmid, batchSize = None):
+        condition = "pmc.pmid >= "+str(int(b_pmid))+" AND pmc.pmid <= "+str(int(e_pmid))
+
+        return list(Article.__loadArticles(condition, batchSize))
 
     
     @staticmethod
     def closeConnection():
         Article.session.close()
+        #do not hand over open connections to forked processes (parallel index build)
+        Article.engine.dispose()
 
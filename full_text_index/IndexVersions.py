@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Versioned Xapian indexes, which are rebuilt while they are searched. A new version of the index <path> is built
+    in the staging directory <path>.versions/<version> and published by replacing the symbolic link <path> with a
+    link to it (rename is atomic, so searchers open either the old or the new version, never a half-built one):
+    xapian/xapian2016 -> xapian2016.versions/20160301120000
+    Searchers that keep the index open (NativeXapian.reopen, SearchServer.py) notice the new link target and open
+    the new version. The previous version is kept, so searchers still reading it are not disturbed and it can be
+    published again with rollbackVersion (RunXapian.py -z).
+"""
+
+import os
+import time
+import shutil
+
+VERSIONS_SUFFIX = ".versions"
+#number of versions kept after publishing a new one: the new and the previous one
+KEEP = 2
+
+def versionsPath(path):
+    return path + VERSIONS_SUFFIX
+
+def listVersions(path):
+    #names of all versions of the index, oldest first - other directories (e.g. the shards of
+    #buildIndexInParallel) are ignored
+    versions = versionsPath(path)
+    if not os.path.isdir(versions):
+        return []
+    return sorted([name for name in os.listdir(versions) if name.isdigit() and os.path.isdir(os.path.join(versions, name))])
+
+def currentVersion(path):
+    #name of the published version, None if the index is no link (e.g. built in place before versions existed)
+    if not os.path.islink(path):
+        return None
+    return os.path.basename(os.path.normpath(os.readlink(path)))
+
+def stageVersion(path):
+    #directory and name of a new, not yet existing version of the index - the name is the time of the build, but
+    #always newer than the existing versions, which are ordered by their names
+    versions = versionsPath(path)
+    if not os.path.isdir(versions):
+        os.makedirs(versions)
+    version = max([int(time.strftime("%Y%m%d%H%M%S"))] + [int(name) + 1 for name in listVersions(path)])
+    while os.path.exists(os.path.join(versions, str(version))):
+        version += 1
+    return versions, str(version)
+
+def publishVersion(path, version, keep = KEEP):
+    #let the link <path> point to <path>.versions/<version> and remove all but the newest keep versions - the
+    #version published before is kept in any case (searchers may still read it, e.g. after a rollback)
+    versions = versionsPath(path)
+    if not os.path.isdir(os.path.join(versions, version)):
+        raise ValueError("version %s of %s is not existing" % (version, path))
+    if os.path.isdir(path) and not os.path.islink(path):
+        #an index built in place becomes the first version - only this move is not atomic
+        os.rename(path, os.path.join(versions, "0"))
+    previous = currentVersion(path) or "0"
+    #the link is relative, so the directory of the indexes can be moved
+    temp = "%s.link%s" % (path, os.getpid())
+    if os.path.lexists(temp):
+        os.remove(temp)
+    os.symlink(os.path.join(os.path.basename(versions), version), temp)
+    os.rename(temp, path)
+    if keep:
+        pruneVersions(path, keep, previous)
+
+def rollbackVersion(path):
+    #publish the version before the current one again, the newer versions are kept
+    versions = listVersions(path)
+    current = currentVersion(path)
+    if current not in versions or versions.index(current) == 0:
+        return None
+    previous = versions[versions.index(current) - 1]
+    publishVersion(path, previous, keep = None)
+    return previous
+
+def pruneVersions(path, keep = KEEP, previous = None):
+    #remove the oldest versions, the published one and previous are never removed
+    current = currentVersion(path)
+    for version in listVersions(path)[:-keep]:
+        if version not in (current, previous):
+            shutil.rmtree(os.path.join(versionsPath(path), version), ignore_errors = True)
@@ -0,0 +1,613 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Indexing and searching with the Xapian bindings only (without xappy). NativeXapian has the same methods as
+    PubMedXapian and writes the same terms, prefixes, value slots, and layouts, so indexes built with one class
+    can be updated and searched with the other one:
+    - one TermGenerator with the English stemmer indexes all free text fields of an article
+    - the field prefixes are taken from the xappy configuration of an existing index or from PREFIXES for new ones
+    - the WritableDatabase flushes its changes every NativeXapian.flushThreshold documents (XAPIAN_FLUSH_THRESHOLD)
+"""
+
+import xapian
+import sys
+import os
+from multiprocessing.pool import ThreadPool
+import cPickle
+from cStringIO import StringIO
+
+from Article import FILTER_FIELDS
+from XapianTools import LAYOUT_KEY, LAYOUTS, WATERMARK_KEY, NUMERIC, readLayout, checkLayout, readWatermark, buildInParallel, \
+                        pageMode, limitTime, limitExpansion, facetValues, cachedSearch
+
+#metadata key of the field configuration written by xappy
+XAPPY_CONFIG_KEY = "_xappy_config"
+
+LANGUAGE = "en"
+FREETEXT, EXACT, SORTABLE, UNPREFIXED, FACET = "freetext", "exact", "sortable", "unprefixed", "facet"
+#fields in the order PubMedXapian.py adds their field actions: (name, type, weight, stored in the layout "xappy")
+FIELDS = [
+    ("title", FREETEXT, 5, True),
+    ("text", FREETEXT, 1, True),
+    ("chemical_exact", EXACT, 0, True),
+    ("keyword", FREETEXT, 1, True),
+    ("mesh", FREETEXT, 1, True),
+    ("year", SORTABLE, 0, False),
+    ("journal", EXACT, 0, False),
+    ("country", EXACT, 0, False),
+    ("pmid", SORTABLE, 0, False),
+    ("all", UNPREFIXED, 1, False),
+    #value slots of the strings for facet counts (see facetCounts)
+    ("journal", FACET, 0, False),
+    ("country", FACET, 0, False),
+]
+#boolean filter terms of the identifiers and metadata of the articles (see filterQuery)
+FIELDS += [(field, EXACT, 0, False) for field in FILTER_FIELDS]
+#xappy assigns the prefixes XA, XB, ... and the value slots 0, 1, ... in this order, so these are the prefixes
+#and slots of every index built with PubMedXapian.py since the fields year, journal, country, pmid, and all exist
+#(the field "all" is free text without prefixed terms, xappy assigns it a prefix nevertheless)
+PREFIXES = {"title": "XA", "text": "XB", "chemical_exact": "XC", "keyword": "XD", "mesh": "XE", "journal": "XF", "country": "XG", "all": "XH",
+            "mesh_ui": "XI", "chemical_ui": "XJ", "issn": "XK", "nlm_id": "XL", "publication_type": "XM", "language": "XN", "author": "XO"}
+SLOTS = {"year": 0, "pmid": 1, "journal": 2, "country": 3}
+
+class _Unpickled(object):
+    #stands in for the xappy classes of a pickled xappy configuration, only its plain field mappings are read
+    def __init__(self, *args, **kwargs):
+        pass
+    def __setstate__(self, state):
+        pass
+
+def _findGlobal(module, name):
+    return _Unpickled
+
+def readFieldMap(database):
+    #prefixes and value slots ("collsort") of the fields of an index built with xappy, None if there is no configuration
+    config = database.get_metadata(XAPPY_CONFIG_KEY)
+    if not config:
+        return None
+    unpickler = cPickle.Unpickler(StringIO(config))
+    unpickler.find_global = _findGlobal
+    mappings = unpickler.load()[1]
+    prefixes, prefixcount, slots, slotcount = cPickle.loads(mappings)
+    return dict(prefixes), dict([(field, slot) for (field, purpose), slot in slots.items() if purpose == "collsort"])
+
+def _registerXappyConfig(path, layout):
+    #store the field actions of PubMedXapian.py in a new index, so the xappy scripts (e.g. search_title.py) can search it
+    #without xappy, the index can only be used with NativeXapian
+    try:
+        import xappy
+    except ImportError:
+        return False
+    conn = xappy.IndexerConnection(path)
+    for field, kind, weight, stored in FIELDS:
+        if kind == FREETEXT and weight != 1:
+            conn.add_field_action(field, xappy.FieldActions.INDEX_FREETEXT, weight=weight, language=LANGUAGE)
+        elif kind == FREETEXT:
+            conn.add_field_action(field, xappy.FieldActions.INDEX_FREETEXT, language=LANGUAGE)
+        elif kind == UNPREFIXED:
+            conn.add_field_action(field, xappy.FieldActions.INDEX_FREETEXT, language=LANGUAGE, allow_field_specific=False)
+        elif kind == EXACT:
+            conn.add_field_action(field, xappy.FieldActions.INDEX_EXACT)
+        elif kind == FACET:
+            conn.add_field_action(field, xappy.FieldActions.SORTABLE)
+        else:
+            conn.add_field_action(field, xappy.FieldActions.SORTABLE, type='float')
+        if stored and layout == "xappy":
+            conn.add_field_action(field, xappy.FieldActions.STORE_CONTENT)
+    conn.flush()
+    conn.close()
+    return True
+
+def isDatabase(path):
+    #a directory with the files of a Xapian database or a stub database file
+    if os.path.isfile(path):
+        return True
+    return any([os.path.isfile(os.path.join(path, name)) for name in ("iamglass", "iamchert", "iamflint", "iamhoney")])
+
+def findShards(path):
+    #a directory that is no Xapian database itself, but contains several ones (e.g. one index per journal built by
+    #PMC/index.py), is searched as one combined database - numbered shards are sorted by their numbers
+    if not os.path.isdir(path) or isDatabase(path):
+        return []
+    names = [name for name in os.listdir(path) if isDatabase(os.path.join(path, name))]
+    names.sort(key = lambda name: (not name.isdigit(), int(name) if name.isdigit() else 0, name))
+    return [os.path.join(path, name) for name in names]
+
+def _exactTerm(prefix, value):
+    #xappy separates prefix and value with ':' if the value starts with an uppercase letter
+    if value and "A" <= value[0] <= "Z":
+        return prefix + ":" + value
+    return prefix + value
+
+class NativeXapian():
+    __indexCount  = 0
+    __indexMsg    = ""
+    #print the number of indexed articles on the command-line
+    showProgress  = True
+    #number of added or replaced documents after which Xapian writes its changes to disk (Xapian's default: 10000)
+    #a higher threshold makes indexing faster and needs more RAM
+    flushThreshold = 100000
+    #QueryCache for the results of searches, e.g. NativeXapian.cache = QueryCache("cache") (None: no cache)
+    cache = None
+    #number of threads searching the shards of a combined index separately, the results are merged afterwards
+    #(1: one search in the combined database, which ranks with the statistics of all shards)
+    shardThreads = 1
+    #seconds after which a search stops checking further documents and returns the best matches found so far
+    #(Enquire.set_time_limit of Xapian 1.4, None: no limit) - results of searches that took so long are not cached
+    timeLimit = None
+    #maximum number of terms a wildcard (e.g. "pancrea*") expands to, the most frequent ones are used
+    maxExpansion = 1000
+    #maximum number of synonyms searched with one query, more synonyms raise a ValueError (None: no limit)
+    maxSynonyms = None
+
+    def __init__(   self,
+                    directory_name,
+                    #no absolut path
+                    xapianPath = "xapian",
+                    #None: layout of the existing index, "xappy" for new indexes
+                    layout = None,
+                 ):
+        self.__xapianPath   = os.path.join( xapianPath, directory_name )
+        self.__layout       = layout
+        self.__prefixes     = None
+        self.__slots        = None
+        self.__searchConn   = None
+        self.__shards       = []
+        #open databases of the shards, their revisions are the key of cached results (see QueryCache.indexRevision)
+        self.__shardDatabases = []
+        #instances and threads searching the shards separately (see __searchShards), kept open between searches
+        self.__shardIndexers = []
+        self.__shardPool    = None
+        #directory opened by the search connection, the link target of a versioned index (see IndexVersions.py)
+        self.__version      = None
+
+    def getLayout(self):
+        if self.__layout == None:
+            self.__layout = "xappy"
+            if os.path.isdir(self.__xapianPath):
+                #the metadata of a combined database is read from its first shard
+                self.__layout = readLayout(self.__openDatabase())
+        return checkLayout(self.__layout)
+
+    def __loadFieldMap(self, database):
+        #the prefix map is built once per connection, the fields of older indexes may be missing in it
+        fieldMap = readFieldMap(database)
+        if fieldMap == None:
+            fieldMap = (PREFIXES, SLOTS)
+        self.__prefixes, self.__slots = fieldMap
+
+    def __openIndexer(self):
+        if not os.path.isdir(self.__xapianPath):
+            _registerXappyConfig(self.__xapianPath, self.getLayout())
+        os.environ["XAPIAN_FLUSH_THRESHOLD"] = str(NativeXapian.flushThreshold)
+        conn = xapian.WritableDatabase(self.__xapianPath, xapian.DB_CREATE_OR_OPEN)
+        self.__loadFieldMap(conn)
+        conn.set_metadata(LAYOUT_KEY, self.getLayout())
+
+        self.__termgen = xapian.TermGenerator()
+        self.__termgen.set_stemmer(xapian.Stem(LANGUAGE))
+        return conn
+
+    def __indexText(self, field, weight, value, prefixed = True):
+        #an unprefixed copy for searches over all fields and a prefixed copy at the same positions, followed by a gap,
+        #so phrases do not match across fields (as xappy's INDEX_FREETEXT)
+        if field not in self.__prefixes: return
+        position = self.__termgen.get_termpos()
+        self.__termgen.index_text(value, weight)
+        if prefixed:
+            self.__termgen.set_termpos(position)
+            self.__termgen.index_text(value, weight, self.__prefixes[field])
+        self.__termgen.increase_termpos(10)
+
+    def __fieldValues(self, article):
+        #articles of full_text_index_title_text do not have chemicals, keywords, and MeSH terms
+        values = {"title": [article.getTitle()]}
+        if article.getAbstract() != None:
+            values["text"] = [article.getAbstract()]
+        #'INDEX_EXACT' - maximum length 220, but prefix "XA" is added to each term in the document
+        if hasattr(article, "getChemicals"):
+            values["chemical_exact"] = [chemical for chemical in article.getChemicals() if len(chemical) < 219]
+            values["all"] = article.getChemicals()
+        if hasattr(article, "getKeywords"):
+            values["keyword"] = article.getKeywords()
+        if hasattr(article, "getMeSH"):
+            values["mesh"] = article.getMeSH()
+        if article.getYear() != None:
+            values["year"] = [str(article.getYear())]
+        if article.getJournal():
+            values["journal"] = [article.getJournal()]
+        if article.getCountry():
+            values["country"] = [article.getCountry()]
+        if hasattr(article, "getFilterTerms"):
+            for field, terms in article.getFilterTerms().items():
+                values[field] = [term for term in terms if len(term) < 219]
+        if self.getLayout() == "xappy":
+            values["pmid"] = [str(article.getPMID())]
+        return values
+
+    def __buildDoc(self, article):
+        if article.getTitle() == None: return None
+
+        doc = xapian.Document()
+        self.__termgen.set_document(doc)
+        values = self.__fieldValues(article)
+        data = {}
+        for field, kind, weight, stored in FIELDS:
+            for value in values.get(field, []):
+                if kind == FREETEXT:
+                    self.__indexText(field, weight, value)
+                elif kind == UNPREFIXED:
+                    self.__indexText(field, weight, value, prefixed = False)
+                elif kind == EXACT and field in self.__prefixes:
+                    doc.add_term(_exactTerm(self.__prefixes[field], value), 0)
+                elif kind == SORTABLE and field in self.__slots:
+                    doc.add_value(self.__slots[field], xapian.sortable_serialise(float(value)))
+                elif kind == FACET and field in self.__slots:
+                    doc.add_value(self.__slots[field], value)
+                if stored:
+                    data.setdefault(field, []).append(value)
+
+        #the layout "xappy" stores the field contents as pickled dictionary and has the ID term "Q<PubMed-ID>"
+        if self.getLayout() == "xappy":
+            doc.set_data(cPickle.dumps(data, 2))
+            doc.add_term("Q" + str(article.getPMID()), 0)
+        return doc
+
+    def __addDocument(self, conn, article, replace = False):
+        doc = self.__buildDoc(article)
+        if doc == None: return False
+        if self.getLayout() == "docid":
+            #replace_document creates the document with this ID if it does not exist
+            conn.replace_document(article.getPMID(), doc)
+        elif replace:
+            conn.replace_document("Q" + str(article.getPMID()), doc)
+        else:
+            conn.add_document(doc)
+        return True
+
+    def __deleteDocument(self, conn, pmid):
+        if self.getLayout() == "docid":
+            try:
+                conn.delete_document(int(pmid))
+            except xapian.DocNotFoundError:
+                pass
+        else:
+            conn.delete_document("Q" + str(pmid))
+
+    def buildIndexWithArticles(self, articles, watermark = None):
+        #watermark is the id of the last row in tbl_change_log covered by the articles (see updateIndexWithArticles)
+        conn = self.__openIndexer()
+
+        for article in articles:
+            try:
+                if not self.__addDocument(conn, article): continue
+            except:
+                continue
+
+            NativeXapian.__indexCount += 1
+            if not NativeXapian.showProgress: continue
+            nbs = len(NativeXapian.__indexMsg)
+            NativeXapian.__indexMsg  = "article %s indexed" % (str(NativeXapian.__indexCount))
+            sys.stdout.write('\b' * nbs + NativeXapian.__indexMsg)
+        if watermark is not None:
+            conn.set_metadata(WATERMARK_KEY, str(watermark))
+        conn.commit()
+        conn.close()
+
+    def getWatermark(self):
+        #id of the last row in tbl_change_log that is contained in the index, None for indexes without watermark
+        return readWatermark(self.__xapianPath)
+
+    def updateIndexWithArticles(self, articles, pmids, watermark):
+        #incremental update: remove all changed PubMed-IDs (inserted or deleted since the last watermark) from the
+        #index, add the articles that exist now, and store the new watermark
+        conn = self.__openIndexer()
+        for pmid in pmids:
+            self.__deleteDocument(conn, pmid)
+        updated = 0
+        for article in articles:
+            try:
+                if not self.__addDocument(conn, article, replace = True): continue
+            except:
+                continue
+            updated += 1
+        conn.set_metadata(WATERMARK_KEY, str(watermark))
+        conn.commit()
+        conn.close()
+        return updated
+
+    def buildIndexInParallel(self, database, schema, b_year, e_year, ranges, batchSize = None, watermark = None):
+        #index each range of PubMed-IDs (Article.getPMIDRanges) in its own process into a separate Xapian
+        #database and merge the shards into the full text index of this instance
+        if not ranges:
+            return self.buildIndexWithArticles([], watermark)
+        buildInParallel(NativeXapian, self.__xapianPath, self.getLayout(), database, schema, b_year, e_year, ranges, batchSize, watermark)
+
+    def __openDatabase(self):
+        #the index itself or all its shards as one database (see findShards) - a link to a version of the index is
+        #resolved first, so reopen notices when another version is published
+        self.__version = os.path.realpath(self.__xapianPath)
+        self.__shards = findShards(self.__version)
+        self.__shardDatabases = [xapian.Database(shard) for shard in self.__shards]
+        if not self.__shards:
+            return xapian.Database(self.__version)
+        database = xapian.Database()
+        for shard in self.__shardDatabases:
+            database.add_database(shard)
+        return database
+
+    def getShards(self):
+        return list(self.__shards)
+
+    def getSearchConnection(self):
+        if self.__searchConn == None:
+            self.__searchConn = self.__openDatabase()
+            self.__loadFieldMap(self.__searchConn)
+        return self.__searchConn
+
+    def reopen(self):
+        #let the next search see the latest revision of the index, e.g. after an update with RunXapian.py -i
+        if self.__searchConn != None:
+            version = os.path.realpath(self.__xapianPath)
+            if version != self.__version or findShards(version) != self.__shards:
+                #a new version was published (e.g. by RunXapian.py -x) or shards were added or removed - the new
+                #version or shards are searchable as soon as they exist
+                self.closeSearchConnection()
+                self.getSearchConnection()
+            else:
+                self.__searchConn.reopen()
+                for shard in self.__shardDatabases:
+                    shard.reopen()
+                self.__loadFieldMap(self.__searchConn)
+                for indexer in self.__shardIndexers:
+                    indexer.reopen()
+
+    def closeSearchConnection(self):
+        #the connection is opened again by the next search, e.g. in a forked worker process
+        if self.__searchConn != None:
+            self.__searchConn.close()
+            self.__searchConn = None
+        self.__shardDatabases = []
+        for indexer in self.__shardIndexers:
+            indexer.closeSearchConnection()
+        self.__shardIndexers = []
+        if self.__shardPool != None:
+            self.__shardPool.close()
+            self.__shardPool.join()
+            self.__shardPool = None
+
+    def fieldQuery(self, field, value):
+        #query for one field as xappy's query_field: exact fields are one term, free text fields are parsed with
+        #stemming (phrases in quotes are not stemmed), unknown fields match nothing
+        self.getSearchConnection()
+        if field not in self.__prefixes:
+            return xapian.Query()
+        if field in [name for name, kind, weight, stored in FIELDS if kind == EXACT]:
+            return xapian.Query(_exactTerm(self.__prefixes[field], value))
+        return self.__parseText(value, self.__prefixes[field])
+
+    def anywhereQuery(self, querystring):
+        #query for the unprefixed terms of all free text fields (title, text, keyword, mesh) and the field "all"
+        #(names of the chemicals, not in older indexes)
+        return self.__parseText(querystring, "")
+
+    def __parseText(self, value, prefix, fielded = False):
+        queryParser = xapian.QueryParser()
+        #wildcards are expanded with the terms of the index
+        queryParser.set_database(self.getSearchConnection())
+        if fielded:
+            #field names in the query, e.g. "title:erlotinib" or "journal:Pancreas" (restricts the query to this journal)
+            for field, kind, weight, stored in FIELDS:
+                if field in self.__prefixes and kind == FREETEXT:
+                    queryParser.add_prefix(field, self.__prefixes[field])
+                elif field in self.__prefixes and kind == EXACT:
+                    queryParser.add_boolean_prefix(field, self.__prefixes[field])
+        queryParser.set_stemmer(xapian.Stem(LANGUAGE))
+        queryParser.set_stemming_strategy(xapian.QueryParser.STEM_SOME)
+        queryParser.set_default_op(xapian.Query.OP_AND)
+        flags = xapian.QueryParser.FLAG_LOVEHATE | xapian.QueryParser.FLAG_PHRASE | xapian.QueryParser.FLAG_BOOLEAN | xapian.QueryParser.FLAG_WILDCARD
+        limitExpansion(queryParser, NativeXapian.maxExpansion)
+        try:
+            return queryParser.parse_query(value, flags, prefix)
+        except xapian.QueryParserError:
+            #boolean operators are the usual cause of parse errors
+            return queryParser.parse_query(value, flags & ~xapian.QueryParser.FLAG_BOOLEAN, prefix)
+
+    def textQuery(self, querystring, fields = ("title", "text")):
+        #query in the syntax of the scripts search_*.py (phrases in quotes, AND, OR, NOT, NEAR/n, ADJ/n, and field
+        #names like "title:") for each of the free text fields, combined with OR
+        self.getSearchConnection()
+        freetext = [name for name, kind, weight, stored in FIELDS if kind == FREETEXT]
+        queries = []
+        for field in fields:
+            if field in freetext and field in self.__prefixes:
+                queries.append(self.__parseText(querystring, self.__prefixes[field], True))
+            else:
+                queries.append(self.fieldQuery(field, querystring))
+        return xapian.Query(xapian.Query.OP_OR, queries)
+
+    def checkFilterTerms(self, terms):
+        #an unknown field or a field the index was built without would filter out all articles without notice
+        self.getSearchConnection()
+        for field in sorted(terms or {}):
+            if field not in FILTER_FIELDS:
+                raise ValueError("unknown filter field %s - use %s" % (field, ", ".join(FILTER_FIELDS)))
+            if field not in self.__prefixes:
+                raise ValueError("the index was built without the filter field %s - build it again with RunXapian.py -x" % (field,))
+
+    def filterQuery(self, query, b_year = None, e_year = None, journal = None, country = None, terms = None):
+        #restrict a query to a range of publication years (inclusive, open-ended if one year is None), a journal,
+        #and a country - as PubMedXapian.filterQuery, indexes without these fields return no results
+        self.getSearchConnection()
+        filters = []
+        if b_year != None or e_year != None:
+            if "year" not in self.__slots:
+                filters.append( xapian.Query() )
+            elif b_year == None:
+                filters.append( xapian.Query(xapian.Query.OP_VALUE_LE, self.__slots["year"], xapian.sortable_serialise(float(e_year))) )
+            elif e_year == None:
+                filters.append( xapian.Query(xapian.Query.OP_VALUE_GE, self.__slots["year"], xapian.sortable_serialise(float(b_year))) )
+            else:
+                filters.append( xapian.Query(xapian.Query.OP_VALUE_RANGE, self.__slots["year"],
+                                             xapian.sortable_serialise(float(b_year)), xapian.sortable_serialise(float(e_year))) )
+        if journal:
+            filters.append( self.fieldQuery('journal', journal) )
+        if country:
+            filters.append( self.fieldQuery('country', country) )
+        #boolean filter terms: field of FILTER_FIELDS -> value or list of values, combined as in PubMedXapian.filterQuery
+        self.checkFilterTerms(terms)
+        for field, values in sorted((terms or {}).items()):
+            if isinstance(values, basestring):
+                values = [values]
+            if field == "author":
+                values = [value.lower() for value in values]
+            filters.append( xapian.Query(xapian.Query.OP_OR, [self.fieldQuery(field, value) for value in values]) )
+        if not filters:
+            return query
+        return xapian.Query(xapian.Query.OP_FILTER, query, xapian.Query(xapian.Query.OP_AND, filters))
+
+    def synonymQuery(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None):
+        #phrase query for each synonym in all fields, combined with OR and restricted by the filters
+        #(the quoted synonym is looked up as exact term in "chemical_exact", as in PubMedXapian.synonymQuery)
+        #concept = True: the synonyms are one group (see SynonymParser.py), combined with OP_SYNONYM instead of OR
+        #anywhere = True: each synonym is searched in all fields with one query (see anywhereQuery)
+        if NativeXapian.maxSynonyms != None and len(synonyms) > NativeXapian.maxSynonyms:
+            raise ValueError("%s synonyms are more than %s synonyms per query" % (len(synonyms), NativeXapian.maxSynonyms))
+        synonym_querys = []
+        for querystring in synonyms:
+            if anywhere:
+                #one phrase query instead of one per field - the posting lists of the terms are read once
+                synonym_querys.append( self.anywhereQuery('"' + querystring + '"') )
+                continue
+            xapian_querys = []
+            for field in ("title", "text", "keyword", "chemical_exact", "mesh"):
+                xapian_querys.append( self.fieldQuery(field, '"' + querystring + '"') )
+            synonym_querys.append( xapian.Query(xapian.Query.OP_OR, xapian_querys) )
+
+        if concept:
+            #all synonyms of one concept: OP_SYNONYM weights their matches like a single term, so the group is
+            #searched in one pass and documents containing several synonyms are not ranked higher
+            merged_q = xapian.Query(xapian.Query.OP_SYNONYM, synonym_querys)
+        else:
+            merged_q = xapian.Query(xapian.Query.OP_OR, synonym_querys)
+        return self.filterQuery(merged_q, b_year, e_year, journal, country, terms)
+
+    def __pmids(self, mset):
+        #PubMed-IDs of a match set: document IDs, the value slot "pmid", or the ID term of older xappy indexes
+        if self.getLayout() == "docid":
+            #the documents of n shards are interleaved in a combined database: docid = (docid in its shard - 1) * n + shard
+            shards = max(len(self.__shards), 1)
+            return [str((match.docid - 1) // shards + 1) for match in mset]
+        if "pmid" in self.__slots:
+            slot = self.__slots["pmid"]
+            return [str(int(xapian.sortable_unserialise(match.document.get_value(slot)))) for match in mset]
+        pmids = []
+        for match in mset:
+            terms = self.__searchConn.termlist(match.docid)
+            pmids.append(terms.skip_to('Q').term[1:])
+        return pmids
+
+    def __cached(self, mode, query, search):
+        #results are looked up in NativeXapian.cache (a QueryCache) first, if it is set
+        self.getSearchConnection()
+        return cachedSearch(NativeXapian.cache, self.__searchConn, self.__xapianPath, mode, query, search, NativeXapian.timeLimit, self.__shardDatabases)
+
+    def findPMIDs(self, query, offset = 0, limit = None):
+        #ranked search, PubMed-IDs are sorted by relevance - offset and limit return one page of the ranking, only
+        #the best offset + limit documents are sorted (None: all matches)
+        return self.__cached(pageMode("ranked", offset, limit), query, lambda: self.__search("ranked", query, offset = offset, limit = limit))
+
+    def matchPMIDs(self, query, offset = 0, limit = None):
+        #set of matching PubMed-IDs without ranking and without loading the stored document data
+        return self.__cached(pageMode("match", offset, limit), query, lambda: self.__search("match", query, offset = offset, limit = limit))
+
+    def countPMIDs(self, query, check_at_least = None):
+        #number of matching documents, no document is returned at all - with check_at_least, the count is exact up
+        #to this number and a lower bound otherwise, which is faster for frequent terms
+        if check_at_least == None:
+            return self.__cached("count", query, lambda: self.__search("count", query))
+        return self.__cached("count%s" % (check_at_least,), query, lambda: self.__matchSet(query, 0, int(check_at_least)).get_matches_lower_bound())
+
+    def facetCounts(self, query, field):
+        #number of matching documents per value of the field ("year", "journal", or "country") as sorted list of
+        #[value, count] - counted from the value slots of all matches, no document is returned at all
+        return self.__cached("facet_" + field, query, lambda: self.__facetCounts(query, field))
+
+    def __facetCounts(self, query, field):
+        self.getSearchConnection()
+        #indexes built before the journal and country were stored in value slots do not have facets
+        if field not in self.__slots:
+            return []
+        spy = xapian.ValueCountMatchSpy(self.__slots[field])
+        self.__matchSet(query, 0, spy = spy)
+        return facetValues(spy, field in NUMERIC)
+
+    def __search(self, mode, query, weights = False, offset = 0, limit = None):
+        #ranked: PubMed-IDs (or (weight, PubMed-ID) tuples with weights = True), match: PubMed-IDs, count: number
+        self.getSearchConnection()
+        if NativeXapian.shardThreads > 1 and len(self.__shards) > 1:
+            return self.__searchShards(mode, query, offset, limit)
+        if limit == None:
+            limit = self.__searchConn.get_doccount()
+        if mode == "ranked" and weights:
+            return self.__rankedMatches(query, offset, limit)
+        if mode == "ranked":
+            return [pmid for weight, pmid in self.__rankedMatches(query, offset, limit)]
+        if mode == "match":
+            return self.__pmids(self.__matchSet(query, limit, first = offset))
+        return self.__matchSet(query, 0).get_matches_estimated()
+
+    def __enquire(self, query):
+        self.getSearchConnection()
+        enquire = xapian.Enquire(self.__searchConn)
+        enquire.set_query(query)
+        limitTime(enquire, NativeXapian.timeLimit)
+        return enquire
+
+    def __rankedMatches(self, query, offset, limit):
+        mset = self.__enquire(query).get_mset(offset, limit)
+        return zip([match.weight for match in mset], self.__pmids(mset))
+
+    def __matchSet(self, query, maxitems, check_at_least = None, spy = None, first = 0):
+        #unranked match: boolean weighting skips the BM25 calculation and documents are returned in docid order
+        #(all matches are checked and seen by the match spy, if check_at_least is not given)
+        enquire = self.__enquire(query)
+        enquire.set_weighting_scheme(xapian.BoolWeight())
+        enquire.set_docid_order(xapian.Enquire.ASCENDING)
+        if spy != None:
+            enquire.add_matchspy(spy)
+        if check_at_least == None:
+            check_at_least = self.__searchConn.get_doccount()
+        return enquire.get_mset(first, maxitems, check_at_least)
+
+    def __searchShards(self, mode, query, offset = 0, limit = None):
+        #search the shards in parallel threads (the Xapian bindings release the GIL) and merge the results -
+        #the weights are computed with the statistics of each shard, so the ranking differs slightly from
+        #the combined database
+        #the instances of the shards are opened by the first search and reopened with this instance (see reopen),
+        #each shard is a single database, so its instance does not search in threads again
+        if not self.__shardIndexers:
+            self.__shardIndexers = [NativeXapian(os.path.basename(shard), xapianPath = os.path.dirname(shard), layout = self.getLayout()) for shard in self.__shards]
+            self.__shardPool = ThreadPool(min(NativeXapian.shardThreads, len(self.__shardIndexers)))
+        #each shard returns its best offset + limit matches, the page is cut from the merged results
+        size = None if limit == None else offset + limit
+        results = self.__shardPool.map(lambda indexer: indexer.__search(mode, query, weights = True, limit = size), self.__shardIndexers)
+        if mode == "ranked":
+            return [pmid for weight, pmid in sorted(sum(results, []), key = lambda match: -match[0])][offset:size]
+        if mode == "match":
+            return sum(results, [])[offset:size]
+        return sum(results)
+
+    def findPMIDsWithSynonyms(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None, offset = 0, limit = None):
+        return self.findPMIDs(self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms), offset, limit)
+
+    def matchPMIDsWithSynonyms(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None, offset = 0, limit = None):
+        return self.matchPMIDs(self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms), offset, limit)
+
+    def countPMIDsWithSynonyms(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None, check_at_least = None):
+        return self.countPMIDs(self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms), check_at_least)
+
+    def facetCountsWithSynonyms(self, synonyms, field, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None):
+        return self.facetCounts(self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms), field)
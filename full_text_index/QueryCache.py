@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Cache for the results of PubMedXapian and NativeXapian searches, e.g. for synonym lists that are searched again
+    and again. The results are kept in memory (least recently used entries are removed first) and, if a directory is
+    given, in one file per query on disk, which is shared by all processes. The key of a result is the search mode,
+    the Xapian query (including all filters), and the UUID and revision of the index, so results of an index that
+    was rebuilt or updated are not used anymore.
+"""
+
+import os
+import time
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import xapian
+
+#revision directories of a replaced index (other UUID) are removed if no result was written to them for this time
+STALE_SECONDS = 3600
+
+def indexRevision(database, path, shards = None):
+    #UUID and revision of an open Xapian database - a combined database of several shards (see
+    #NativeXapian.findShards) has no revision of its own, its key are the revisions of the open shards
+    try:
+        uuid = database.get_uuid()
+    except (AttributeError, xapian.InvalidOperationError):
+        uuid = ""
+    try:
+        if shards:
+            revision = "-".join([str(shard.get_revision()) for shard in shards])
+        else:
+            revision = str(database.get_revision())
+    except (AttributeError, xapian.InvalidOperationError):
+        #older Xapian versions without revisions: the latest modification time of all files of the index
+        revision = "%.6f" % max([os.path.getmtime(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files] or [0])
+    return "%s_%s" % (uuid or "index", revision)
+
+def revisionOrder(revision):
+    #(UUID, revision numbers) of a revision of indexRevision, None for other names
+    uuid, separator, numbers = revision.rpartition("_")
+    try:
+        return uuid, [float(number) for number in numbers.split("-")]
+    except ValueError:
+        return None
+
+def isOlderRevision(name, revision, directory):
+    #True if the revision directory name is older than the current revision: a lower revision of the same index,
+    #or a revision of a replaced index (other UUID or other shards) that was not used for STALE_SECONDS
+    order, current = revisionOrder(name), revisionOrder(revision)
+    if order == None or current == None:
+        return False
+    if order[0] == current[0] and len(order[1]) == len(current[1]):
+        return order[1] < current[1]
+    try:
+        return time.time() - os.path.getmtime(directory) > STALE_SECONDS
+    except OSError:
+        return False
+
+def fromJSON(value):
+    #results read from disk as they were returned by the search: PubMed-IDs and terms are str, not unicode
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    if isinstance(value, list):
+        return [fromJSON(item) for item in value]
+    return value
+
+class QueryCache():
+
+    def __init__(self, directory = None, size = 1000):
+        #directory: on-disk store (None: in memory only), size: number of results kept in memory
+        self.__directory = directory
+        self.__size      = int(size)
+        self.__memory    = OrderedDict()
+        self.__lock      = threading.Lock()
+        #revision directories of the indexes already checked by this process
+        self.__revisions = set()
+        self.hits        = 0
+        self.misses      = 0
+
+    def lookup(self, database, path, mode, query, search, complete = None, shards = None):
+        #result of the search function for the query, computed by search() only if it is not cached yet - the result
+        #is not cached if complete() returns False afterwards (e.g. a search stopped by a time limit)
+        #shards: the open databases of a combined database, their revisions identify the cached results
+        revision = indexRevision(database, path, shards)
+        key = "%s\t%s\t%s\t%s" % (os.path.abspath(path), revision, mode, query)
+        value = self.__get(key, path, revision)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = search()
+        if complete == None or complete():
+            self.__put(key, path, revision, value)
+        return value
+
+    def __get(self, key, path, revision):
+        with self.__lock:
+            if key in self.__memory:
+                value = self.__memory.pop(key)
+                self.__memory[key] = value
+                return value
+        if self.__directory == None:
+            return None
+        try:
+            infile = open(self.__file(key, path, revision), "r")
+        except IOError:
+            return None
+        try:
+            value = fromJSON(json.load(infile))
+        except ValueError:
+            return None
+        finally:
+            infile.close()
+        self.__remember(key, value)
+        return value
+
+    def __put(self, key, path, revision, value):
+        self.__remember(key, value)
+        if self.__directory == None:
+            return
+        filename = self.__file(key, path, revision)
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                #created by another process in the meantime
+                pass
+        #write to a temporary file first, so other processes never read a partial result - the directory may be
+        #removed by a process that already searches a newer revision, the result is kept in memory only then
+        temp = None
+        try:
+            handle, temp = tempfile.mkstemp(dir = directory)
+            outfile = os.fdopen(handle, "w")
+            json.dump(value, outfile)
+            outfile.close()
+            os.rename(temp, filename)
+        except OSError:
+            if temp != None:
+                try:
+                    os.remove(temp)
+                except OSError:
+                    pass
+
+    def __remember(self, key, value):
+        with self.__lock:
+            self.__memory.pop(key, None)
+            self.__memory[key] = value
+            while len(self.__memory) > self.__size:
+                self.__memory.popitem(last = False)
+
+    def __file(self, key, path, revision):
+        #<directory>/<index path>/<revision>/<query>.json - the results of older revisions of the index are removed,
+        #other processes may still search a newer revision (before their reopen) or the previous one
+        index = os.path.join(self.__directory, hashlib.sha1(os.path.abspath(path)).hexdigest())
+        if (index, revision) not in self.__revisions:
+            self.__revisions.add((index, revision))
+            if os.path.isdir(index):
+                for name in os.listdir(index):
+                    if name != revision and isOlderRevision(name, revision, os.path.join(index, name)):
+                        shutil.rmtree(os.path.join(index, name), ignore_errors = True)
+        return os.path.join(index, revision, hashlib.sha1(key).hexdigest() + ".json")
+
+    def clear(self):
+        with self.__lock:
+            self.__memory.clear()
+        if self.__directory != None and os.path.isdir(self.__directory):
+            shutil.rmtree(self.__directory, ignore_errors = True)
@@ -10,7 +10,6 @@
 #"python RunXapian.py" for searching
 #"python RunXapian.py -h" for help
 
-import xappy
 import os.path
 import sys
 import os
@@ -20,7 +19,6 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from SynonymParser import SynonymParser
-from PubMedXapian import PubMedXapian
 
 from optparse import OptionParser
 
@@ -35,6 +33,24 @@ if __name__=="__main__":
     parser.add_option("-f", "--no_search", dest="f", action="store_false", help="find synonyms in Xapian database (default: True)", default=True)
     parser.add_option("-r", "--results_name", dest="r", help="name of the results file (default: results.csv)", default = "results")
     parser.add_option("-n", "--name_xapian_db", dest="n", help="name of the xapian database folder (default: xapian<e_year>)", default = "xapian")
+    parser.add_option("-u", "--subset", dest="u", help="name of a subset created with PubMedSubset.py that is indexed instead of the schema pubmed (optional)", default = None)
+    parser.add_option("-j", "--processes", dest="j", help="number of processes building index shards in parallel (merged with xapian-compact afterwards) (default: 1)", default = 1)
+    parser.add_option("-J", "--search_processes", dest="J", help="number of processes searching the synonyms in parallel, independent of the shards of \"-j\" (default: 1)", default = 1)
+    parser.add_option("-i", "--incremental", dest="i", action="store_true", default=False, help="Update an existing Xapian index with the citations inserted or deleted by PubMedParser.py since it was built or updated (default: False)")
+    parser.add_option("-y", "--years", dest="y", help="only find articles published in this range of years, e.g. 2005-2010, 2005- or -2010 (optional)", default = None)
+    parser.add_option("-t", "--journal", dest="t", help="only find articles of this journal (MEDLINE abbreviation, e.g. \"Pancreas\", optional)", default = None)
+    parser.add_option("-o", "--country", dest="o", help="only find articles of journals from this country (e.g. \"United States\", optional)", default = None)
+    parser.add_option("-m", "--match_only", dest="m", action="store_true", default=False, help="find the PubMed-IDs without ranking them by relevance, which is much faster for frequent synonyms (default: False)")
+    parser.add_option("-l", "--layout", dest="l", help="layout of a new index: \"xappy\" (stored field contents) or \"docid\" (document ID = PubMed-ID, no stored contents, smaller) (default: xappy)", default = None)
+    parser.add_option("-w", "--native", dest="w", action="store_true", default=False, help="index and search with the Xapian bindings only (NativeXapian.py) instead of xappy, which indexes faster (default: False)")
+    parser.add_option("-g", "--groups", dest="g", action="store_true", default=False, help="the synonym file contains one group of tab-separated synonyms per line (e.g. synonyms/pancreatic_cancer_groups.txt), each group is searched with one query and written with its first synonym (default: False)")
+    parser.add_option("-a", "--attribute", dest="a", action="store_true", default=False, help="with \"-g\", append the synonyms of the group found in each PubMed-ID to its line in the results file (default: False)")
+    parser.add_option("-q", "--anywhere", dest="q", action="store_true", default=False, help="search each synonym with one phrase query over the unprefixed terms of all fields instead of one query per field, which is faster (default: False)")
+    parser.add_option("-k", "--cache", dest="k", help="directory of a cache for the search results, repeated searches of an unchanged index only read the results from there (optional)", default = None)
+    parser.add_option("-F", "--filter", dest="F", action="append", default=[], help="only find articles with this identifier or metadata, e.g. -F author=\"friess h\" -F language=eng - fields: mesh_ui, chemical_ui, issn, nlm_id, publication_type, language, author (\"<last name> <initials>\"), several values of a field are combined with OR (optional)")
+    parser.add_option("-z", "--rollback", dest="z", action="store_true", default=False, help="publish the previous version of the index again, e.g. if the last build with \"-x\" went wrong (default: False)")
+    parser.add_option("-T", "--time_limit", dest="T", help="seconds after which the search of a synonym returns the best matches found so far instead of all matches - needs Xapian 1.4 (optional)", default = None)
+    parser.add_option("-c", "--batch_size", dest="c", help="number of articles fetched at once from PostgreSQL while indexing (default: 1000)", default = 1000)
     
     (options, args) = parser.parse_args()
     
@@ -62,31 +78,115 @@ if __name__=="__main__":
     if not (os.path.isfile(synonymPath)):
         sys.exit( "synonym file not existing - programme terminates" )
 
-    if options.x:
+    #number of processes for indexing (one shard each) and for searching
+    processes = int(options.j)
+    search_processes = int(options.J)
+    #schema pubmed or the name of a subset
+    schema = options.u or "pubmed"
+
+    if options.x or options.i:
         #import class Article from Article.py and connect to PostgreSQL database
         from Article import Article
-        Article.getConnection(database)
+        Article.getConnection(database, schema)
+    if options.x:
+        #changes logged by PubMedParser.py from now on are applied by the next incremental update (-i)
+        watermark = Article.getChangeWatermark()
+    if options.x and processes == 1:
         #select all articles in a range of years x >= b_year and x <= e_year
-        articles = Article.getArticlesByYear(b_year,e_year)
-        Article.closeConnection()
+        #the articles are loaded lazily while indexing, so the connection is closed afterwards
+        articles = Article.iterArticlesByYear(b_year,e_year,int(options.c))
         print "\n-------------"
         print "processing files from year " + str(b_year) + " to " + str(e_year)
         print "-------------"
-        print "got articles from PostgreSQL database"
-        print "-------------"
+    #NativeXapian does not need xappy, both classes build and search the same indexes
+    if options.w:
+        from NativeXapian import NativeXapian as PubMedXapian
+    else:
+        from PubMedXapian import PubMedXapian
+    #results of an unchanged index are read from the cache, rebuilt or updated indexes are searched again
+    if options.k:
+        from QueryCache import QueryCache
+        PubMedXapian.cache = QueryCache(options.k)
+    if options.T:
+        PubMedXapian.timeLimit = float(options.T)
     #take the last year to create directory
-    indexer  = PubMedXapian(xapian_name, xapianPath = options.xapian_database_path)
-    #build full text index with Xapian for all articles selected before
+    indexer  = PubMedXapian(xapian_name, xapianPath = options.xapian_database_path, layout = options.l)
+    xapian_path = os.path.join(options.xapian_database_path, xapian_name)
     if options.x:
+        #the index is built as a new version in a staging directory and published when it is complete, so it can
+        #be searched during the build (see IndexVersions.py) - the layout of the published version is kept
+        from IndexVersions import stageVersion, publishVersion
+        versions, version = stageVersion(xapian_path)
+        builder = PubMedXapian(version, xapianPath = versions, layout = options.l or indexer.getLayout())
+    #build full text index with Xapian for all articles selected before
+    if options.x and processes == 1:
        print "now indexing articles in Xapian"
-       indexer.buildIndexWithArticles(articles)
+       builder.buildIndexWithArticles(articles, watermark)
+       Article.closeConnection()
+       print "\n-------------"
+    #each process connects to PostgreSQL and indexes the articles of its shard
+    elif options.x:
+       ranges = Article.getPMIDRanges(b_year, e_year, processes)
+       Article.closeConnection()
+       print "\n-------------"
+       print "processing files from year " + str(b_year) + " to " + str(e_year) + " with " + str(processes) + " processes"
+       print "-------------"
+       builder.buildIndexInParallel(database, schema, b_year, e_year, ranges, int(options.c), watermark)
+       print "-------------"
+    if options.x:
+       publishVersion(xapian_path, version)
+       print "version %s of the index published" % (version,)
+    #apply the citations inserted and deleted by PubMedParser.py since the last build or update
+    elif options.i:
+       if not ( os.path.isdir( os.path.join(options.xapian_database_path, xapian_name) ) ):
+           exit("xapian files are not existing - build the index with \"-x\" first")
+       watermark = indexer.getWatermark()
+       if watermark == None:
+           exit("the index does not contain a change watermark - build it once again with \"-x\"")
+       last_id, inserted, deleted = Article.getChanges(watermark)
        print "\n-------------"
+       print "updating index with %s inserted and %s deleted PubMed-IDs" % (len(inserted), len(deleted))
+       articles = Article.iterArticlesByPMIDs(inserted, b_year, e_year, int(options.c))
+       updated = indexer.updateIndexWithArticles(articles, inserted + deleted, last_id)
+       Article.closeConnection()
+       print "%s articles added or replaced" % (updated,)
+       print "-------------"
+    #searchers that keep the index open (SearchServer.py) reopen the previous version by themselves
+    if options.z:
+        from IndexVersions import rollbackVersion
+        version = rollbackVersion(xapian_path)
+        if version == None:
+            sys.exit("no previous version of the index existing - programme terminates")
+        print "version %s of the index published again" % (version,)
     if not ( os.path.isdir( os.path.join(options.xapian_database_path, xapian_name) ) ):
         parser.print_help()
         exit("xapian files are not existing")
     if options.f:
-        synonymParser = SynonymParser(synonymPath, indexer, filename)
-        synonymParser.parseAndFind()
+        #the year, journal, and country filters are applied at search time, so one index serves all of them
+        search_b_year, search_e_year = None, None
+        if options.y:
+            years = options.y.split("-")
+            if len(years) != 2:
+                sys.exit("use \"-y <begin>-<end>\" to restrict the range of years - programme terminates")
+            search_b_year = int(years[0]) if years[0] else None
+            search_e_year = int(years[1]) if years[1] else None
+        #boolean filter terms, evaluated in the index together with the synonyms
+        terms = {}
+        for term in options.F:
+            if not "=" in term:
+                sys.exit("use \"-F <field>=<value>\" to filter the articles - programme terminates")
+            field, value = term.split("=", 1)
+            terms.setdefault(field.strip(), []).append(value.strip())
+        try:
+            indexer.checkFilterTerms(terms)
+        except ValueError, e:
+            sys.exit("%s - programme terminates" % (e,))
+        #the search processes open their own connections
+        indexer.closeSearchConnection()
+        synonymParser = SynonymParser(synonymPath, indexer, filename, search_b_year, search_e_year, options.t, options.o, not options.m, options.g, options.a, options.q, terms)
+        synonymParser.parseAndFind(search_processes)
+        if options.k and search_processes == 1:
+            print "\n%s searches read from the cache, %s searched in the index" % (PubMedXapian.cache.hits, PubMedXapian.cache.misses)
         if filename == "results":
             print "\nquery results written to %s.csv" % filename
         else:
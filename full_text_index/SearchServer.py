@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Long-running search service that keeps Xapian indexes open and answers queries with JSON over HTTP or a Unix
+    socket. The requests are handled by a fixed number of worker threads ("-w"), each worker opens its own
+    connections (NativeXapian) when it starts and keeps them for all its requests, and the connections are reopened
+    before each search, so updates of an index are visible without restarting. Results are
+    cached per revision of the index (QueryCache.py), e.g.:
+    python SearchServer.py -n xapian2016,xapian_all -P 8765
+    curl "http://localhost:8765/synonyms?synonym=KRAS&synonym=KRAS2&mode=match&b_year=2010"
+    curl "http://localhost:8765/query?q=pancreatic+NEAR/3+cancer&field=title&index=xapian_all"
+    curl "http://localhost:8765/synonyms?synonym=KRAS&mode=facet&facet=year"
+    curl "http://localhost:8765/synonyms?synonym=pancreatic+cancer&filter=author=friess+h&filter=language=eng"
+    curl "http://localhost:8765/synonyms?synonym=pancreatic+cancer&offset=100&limit=100"
+    curl "http://localhost:8765/indexes"
+
+    Endpoints (GET parameters or a JSON object in the body of a POST request):
+    /synonyms   synonym (several), mode (ranked, match, count, or facet), b_year, e_year, journal, country,
+                concept, anywhere (1 or 0), filter (several, <field>=<value>) - as RunXapian.py
+                mode=ranked or match: offset and limit (page of the results, default: 0 and "-r"), the result
+                contains the PubMed-IDs of the page and the number of all matches (exact up to offset + limit)
+                mode=count: check_at_least (exact count up to this number, a lower bound above, optional)
+                mode=facet: facet (year, journal, or country) - number of matches per value, e.g. per year
+    /query      q (query in the syntax of the scripts search_*.py), field (several, default: title and text),
+                mode, b_year, e_year, journal, country, filter
+    /indexes    names, number of documents, and layouts of the served indexes
+    Every search takes the parameter index (default: the first index given with "-n"). Searches stop after the
+    time limit "-L" with the best matches found so far, queries with more synonyms than "-e" are rejected.
+"""
+
+import os
+import sys
+import time
+import json
+import urlparse
+import Queue
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from optparse import OptionParser
+
+import xapian
+from NativeXapian import NativeXapian
+from QueryCache import QueryCache
+
+#names of the served indexes and the directory containing them (set in __main__)
+INDEXES = []
+XAPIAN_PATH = "xapian"
+#maximum number of PubMed-IDs returned by one search (set in __main__)
+MAX_RESULTS = 1000
+#connections of the current worker thread: index name -> NativeXapian
+_local = threading.local()
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+def getIndexer(name):
+    #one NativeXapian per thread and index, Xapian databases must not be shared between threads
+    if name not in INDEXES:
+        raise RequestError(404, "unknown index %s" % (name,))
+    indexers = _local.__dict__.setdefault("indexers", {})
+    if name not in indexers:
+        indexers[name] = NativeXapian(name, xapianPath = XAPIAN_PATH)
+    indexer = indexers[name]
+    indexer.getSearchConnection()
+    indexer.reopen()
+    return indexer
+
+def _value(params, name, default = None):
+    values = params.get(name)
+    if not values or values[0] in (None, ""):
+        return default
+    return values[0]
+
+def _flag(params, name):
+    return str(_value(params, name, "0")).lower() in ("1", "true", "yes")
+
+def _year(params, name):
+    year = _value(params, name)
+    if year == None:
+        return None
+    try:
+        return int(year)
+    except ValueError:
+        raise RequestError(400, "%s has to be a year" % (name,))
+
+def _number(params, name, default):
+    number = _value(params, name, default)
+    if not str(number).isdigit():
+        raise RequestError(400, "%s has to be a number" % (name,))
+    return int(number)
+
+def _terms(params):
+    #boolean filter terms "<field>=<value>" as dictionary field -> list of values
+    terms = {}
+    for term in params.get("filter", []):
+        if "=" not in term:
+            raise RequestError(400, "filter has to be <field>=<value>")
+        field, value = term.split("=", 1)
+        terms.setdefault(field.strip(), []).append(value.strip())
+    return terms
+
+def _filters(params):
+    return {"b_year": _year(params, "b_year"), "e_year": _year(params, "e_year"),
+            "journal": _value(params, "journal"), "country": _value(params, "country"), "terms": _terms(params)}
+
+def _execute(indexer, query, mode, params):
+    if mode in ("ranked", "match"):
+        #only one page of at most MAX_RESULTS PubMed-IDs is returned, the ranking is not computed beyond it
+        offset = _number(params, "offset", 0)
+        limit = min(_number(params, "limit", MAX_RESULTS), MAX_RESULTS)
+        if mode == "ranked":
+            pmids = indexer.findPMIDs(query, offset, limit)
+        else:
+            pmids = indexer.matchPMIDs(query, offset, limit)
+        return {"count": indexer.countPMIDs(query, offset + limit), "offset": offset, "pmids": pmids}
+    if mode == "count":
+        check_at_least = _value(params, "check_at_least")
+        if check_at_least != None and not check_at_least.isdigit():
+            raise RequestError(400, "check_at_least has to be a number")
+        return {"count": indexer.countPMIDs(query, check_at_least)}
+    if mode == "facet":
+        field = _value(params, "facet", "year")
+        if field not in ("year", "journal", "country"):
+            raise RequestError(400, "unknown facet %s - use year, journal, or country" % (field,))
+        return {"facet": field, "counts": indexer.facetCounts(query, field)}
+    raise RequestError(400, "unknown mode %s - use ranked, match, count, or facet" % (mode,))
+
+def searchSynonyms(params):
+    synonyms = [synonym for synonym in params.get("synonym", []) if synonym]
+    if not synonyms:
+        raise RequestError(400, "no synonym given")
+    indexer = getIndexer(_value(params, "index", INDEXES[0]))
+    query = indexer.synonymQuery(synonyms, concept = _flag(params, "concept"), anywhere = _flag(params, "anywhere"), **_filters(params))
+    return query, _execute(indexer, query, _value(params, "mode", "ranked"), params)
+
+def searchQuery(params):
+    querystring = _value(params, "q")
+    if not querystring:
+        raise RequestError(400, "no query q given")
+    indexer = getIndexer(_value(params, "index", INDEXES[0]))
+    fields = [field for field in params.get("field", []) if field] or ["title", "text"]
+    query = indexer.filterQuery(indexer.textQuery(querystring, fields), **_filters(params))
+    return query, _execute(indexer, query, _value(params, "mode", "ranked"), params)
+
+def listIndexes(params):
+    indexes = {}
+    for name in INDEXES:
+        indexer = getIndexer(name)
+        indexes[name] = {"documents": indexer.getSearchConnection().get_doccount(), "layout": indexer.getLayout()}
+    return None, {"indexes": indexes}
+
+ENDPOINTS = {"/synonyms": searchSynonyms, "/query": searchQuery, "/indexes": listIndexes}
+
+class SearchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        self.__respond(url.path, urlparse.parse_qs(url.query))
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        try:
+            length = int(self.headers.getheader("content-length") or 0)
+            body = json.loads(self.rfile.read(length) or "{}")
+        except ValueError:
+            return self.__send(400, {"error": "the body is no JSON object"})
+        #same form as parse_qs: every parameter is a list of strings
+        params = {}
+        for name, value in body.items():
+            if not isinstance(value, list):
+                value = [value]
+            params[str(name)] = [v if isinstance(v, basestring) else json.dumps(v) for v in value]
+        self.__respond(url.path, params)
+
+    def __respond(self, path, params):
+        if path not in ENDPOINTS:
+            return self.__send(404, {"error": "unknown path %s - use %s" % (path, ", ".join(sorted(ENDPOINTS)))})
+        start = time.time()
+        try:
+            try:
+                query, result = ENDPOINTS[path](params)
+            except xapian.DatabaseModifiedError:
+                #the index was changed too often during the search, reopen it and try once again
+                query, result = ENDPOINTS[path](params)
+        except RequestError, e:
+            return self.__send(e.status, {"error": str(e)})
+        except ValueError, e:
+            #e.g. more synonyms than allowed per query or an unknown filter field
+            return self.__send(400, {"error": str(e)})
+        except xapian.Error, e:
+            return self.__send(500, {"error": "%s: %s" % (type(e).__name__, e)})
+        if query != None:
+            result["query"] = str(query)
+        result["time_ms"] = round(1000.0 * (time.time() - start), 2)
+        self.__send(200, result)
+
+    def __send(self, status, result):
+        body = json.dumps(result)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        #clients of a Unix socket do not have an address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+class WorkerPoolMixIn:
+    #requests are queued and handled by a fixed number of long-lived worker threads instead of one new thread per
+    #request (SocketServer.ThreadingMixIn), so the connections of each worker (getIndexer) stay open and warm
+    workers = 8
+
+    def process_request(self, request, client_address):
+        if not hasattr(self, "requests"):
+            self.requests = Queue.Queue()
+            for i in range(self.workers):
+                worker = threading.Thread(target = self.__work)
+                worker.daemon = True
+                worker.start()
+        self.requests.put((request, client_address))
+
+    def __work(self):
+        #open the connections of this worker before its first request - an index that cannot be opened now (missing,
+        #locked, or being republished) is opened with the first request for it
+        for name in INDEXES:
+            try:
+                getIndexer(name)
+            except Exception, e:
+                sys.stderr.write("worker could not open %s, opening it with the next request: %s: %s\n" % (name, type(e).__name__, e))
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+class ThreadingHTTPServer(WorkerPoolMixIn, BaseHTTPServer.HTTPServer):
+    pass
+
+class ThreadingUnixHTTPServer(WorkerPoolMixIn, SocketServer.UnixStreamServer):
+    pass
+
+if __name__=="__main__":
+    parser = OptionParser()
+    parser.add_option("-p", "--xapian_database_path", dest="p", help="directory of the Xapian full text indexes (default: xapian)", default="xapian")
+    parser.add_option("-n", "--name_xapian_db", dest="n", help="comma-separated names of the served indexes, the first one is the default (default: xapian2016)", default = "xapian2016")
+    parser.add_option("-H", "--host", dest="H", help="host name or address to listen on (default: localhost)", default = "localhost")
+    parser.add_option("-P", "--port", dest="P", help="TCP port to listen on (default: 8765)", default = 8765)
+    parser.add_option("-c", "--cache", dest="c", help="directory of a cache for the search results on disk, in addition to the results kept in memory (optional)", default = None)
+    parser.add_option("-m", "--cache_size", dest="m", help="number of search results kept in memory, 0 turns the cache off (default: 1000)", default = 1000)
+    parser.add_option("-t", "--shard_threads", dest="t", help="number of threads searching the shards of an index that consists of several indexes in parallel (default: 1)", default = 1)
+    parser.add_option("-r", "--max_results", dest="r", help="maximum number of PubMed-IDs returned by one search, the parameter limit of a request is capped to it (default: 1000)", default = 1000)
+    parser.add_option("-L", "--time_limit", dest="L", help="seconds after which a search returns the best matches found so far, 0 turns the limit off - needs Xapian 1.4 (default: 10)", default = 10)
+    parser.add_option("-e", "--max_synonyms", dest="e", help="maximum number of synonyms per query, 0 turns the limit off (default: 1000)", default = 1000)
+    parser.add_option("-w", "--workers", dest="w", help="number of worker threads handling requests, each keeps its own connections to the indexes (default: 8)", default = 8)
+    parser.add_option("-S", "--socket", dest="S", help="listen on this Unix socket instead of a TCP port (optional)", default = None)
+
+    (options, args) = parser.parse_args()
+
+    XAPIAN_PATH = options.p
+    INDEXES = [name.strip() for name in options.n.split(",") if name.strip()]
+    for name in INDEXES:
+        if not os.path.isdir(os.path.join(XAPIAN_PATH, name)):
+            sys.exit("xapian files of %s are not existing - programme terminates" % (name,))
+
+    NativeXapian.shardThreads = int(options.t)
+    MAX_RESULTS = int(options.r)
+    WorkerPoolMixIn.workers = max(int(options.w), 1)
+    NativeXapian.timeLimit = float(options.L) or None
+    NativeXapian.maxSynonyms = int(options.e) or None
+    #results are cached per revision of the index, updates of an index are searched again
+    if int(options.m) > 0 or options.c:
+        NativeXapian.cache = QueryCache(options.c, options.m)
+
+    if options.S:
+        if os.path.exists(options.S):
+            os.remove(options.S)
+        server = ThreadingUnixHTTPServer(options.S, SearchHandler)
+        print "serving %s on %s" % (", ".join(INDEXES), options.S)
+    else:
+        server = ThreadingHTTPServer((options.H, int(options.P)), SearchHandler)
+        print "serving %s on http://%s:%s" % (", ".join(INDEXES), options.H, options.P)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    if options.S and os.path.exists(options.S):
+        os.remove(options.S)
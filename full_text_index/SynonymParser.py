@@ -4,31 +4,96 @@
     Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
 """
 
-import xappy
 import sys
+import multiprocessing
+
+#PubMedXapian instance and search options of a worker process (set by _initWorker)
+_worker = {}
+
+def _initWorker(pubMedXapian, filters, ranked, attribute):
+    #every worker process opens its own SearchConnection
+    pubMedXapian.closeSearchConnection()
+    _worker["pubMedXapian"] = pubMedXapian
+    _worker["filters"]      = filters
+    _worker["ranked"]       = ranked
+    _worker["attribute"]    = attribute
+
+def _search(group):
+    return _searchGroup(_worker["pubMedXapian"], group, _worker["filters"], _worker["ranked"], _worker["attribute"])
+
+def _find(pubMedXapian, synonyms, filters, ranked):
+    #a group of several synonyms is searched with one query (OP_SYNONYM)
+    concept = len(synonyms) > 1
+    if ranked:
+        return pubMedXapian.findPMIDsWithSynonyms(synonyms, concept = concept, **filters)
+    return pubMedXapian.matchPMIDsWithSynonyms(synonyms, concept = concept, **filters)
+
+def _searchGroup(pubMedXapian, group, filters, ranked, attribute):
+    #returns the name of the group, its PubMed-IDs and, with attribute = True, the synonyms found per PubMed-ID
+    name, synonyms = group
+    pmids = _find(pubMedXapian, synonyms, filters, ranked)
+    found = {}
+    if attribute and len(synonyms) > 1:
+        #one unranked search per synonym, only done on request
+        for synonym in synonyms:
+            for pmid in pubMedXapian.matchPMIDsWithSynonyms([synonym], **filters):
+                found.setdefault(pmid, []).append(synonym)
+    return name, pmids, found
+
+def readGroups(path, groups = False):
+    #one synonym per line, or with groups = True one group per line: all tab-separated synonyms of a concept,
+    #the first one is the name of the group (a line with one synonym is a group of its own)
+    for row in open(path):
+        if groups:
+            synonyms = [synonym.strip() for synonym in row.split("\t") if synonym.strip()]
+            if synonyms:
+                yield synonyms[0], synonyms
+        else:
+            yield row.strip(), [row.strip()]
 
 class SynonymParser():
 
     __msg       = ""
     __cidCount  = 0
 
-    def __init__(self, path, pubMedXapian, filename):
+    def __init__(self, path, pubMedXapian, filename, b_year = None, e_year = None, journal = None, country = None, ranked = True, groups = False, attribute = False, anywhere = False, terms = None):
         self.__path         = path
         self.__pubMedXapian = pubMedXapian
+        #ranked: PubMed-IDs sorted by relevance, otherwise the unranked match set sorted by document ID (faster)
+        self.__ranked       = ranked
+        #search filters passed to findPMIDsWithSynonyms (anywhere: one query over all fields per synonym, terms:
+        #boolean filter terms, see PubMedXapian.filterQuery)
+        self.__filters      = {"b_year": b_year, "e_year": e_year, "journal": journal, "country": country, "anywhere": anywhere, "terms": terms}
+        #groups: one concept with tab-separated synonyms per line, its PubMed-IDs are written with the name of the group
+        #attribute: the synonyms of the group found in each PubMed-ID are appended to its line
+        self.__groups       = groups
+        self.__attribute    = attribute
         if ".csv" in filename or ".txt" in filename:
             self.__outfile      = open("results/"+filename,'w')
         else:
             self.__outfile      = open("results/"+filename+".csv",'w')
         
-    def parseAndFind(self):
+    def parseAndFind(self, processes = 1, chunksize = 20):
+        #with processes > 1, the synonyms are searched by a pool of worker processes - imap keeps the order
+        #of the synonym file, so the results file is the same as with one process
+        groups = readGroups(self.__path, self.__groups)
+        if int(processes) > 1:
+            pool = multiprocessing.Pool(int(processes), _initWorker, (self.__pubMedXapian, self.__filters, self.__ranked, self.__attribute))
+            results = pool.imap(_search, groups, chunksize)
+        else:
+            pool = None
+            results = (_searchGroup(self.__pubMedXapian, group, self.__filters, self.__ranked, self.__attribute) for group in groups)
 
-        for row in open(self.__path):
-            synonym = row.strip()
-            pmids = self.__pubMedXapian.findPMIDsWithSynonyms([synonym])
+        for synonym, pmids, found in results:
             for pmid in pmids: 
-                self.__outfile.write(str(pmid)+"\t"+str(synonym)+"\n")
+                self.__outfile.write("\t".join([str(pmid), str(synonym)] + found.get(pmid, []))+"\n")
             SynonymParser.__cidCount += 1                    
             nbs                 = len(SynonymParser.__msg)        
             SynonymParser.__msg  = "number of synonyms searched: %s " % (str(SynonymParser.__cidCount))
             sys.stdout.write('\b' * nbs + SynonymParser.__msg)
+        self.__outfile.close()
+
+        if pool != None:
+            pool.close()
+            pool.join()
 
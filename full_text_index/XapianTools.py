@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Functions shared by PubMedXapian (xappy) and NativeXapian (Xapian bindings only), which do not depend on the
+    indexer: the layout and change watermark stored in the metadata of an index, building an index from shards in
+    parallel processes and merging them with xapian-compact, and the search options (pages of results, time limit,
+    wildcard expansion, facet counts, and the lookup in a QueryCache).
+"""
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+import multiprocessing
+import xapian
+
+#metadata key of the index that stores the last applied row of tbl_change_log
+WATERMARK_KEY = "pubmedportable_change_id"
+#metadata key of the index that stores its layout:
+#"xappy" - documents with xappy IDs (ID term "Q<PubMed-ID>") and stored field contents
+#"docid" - the Xapian document ID is the PubMed-ID, no ID term and no stored contents (load articles from PostgreSQL)
+LAYOUT_KEY = "pubmedportable_layout"
+LAYOUTS = ("xappy", "docid")
+#fields with numbers in their value slots (sortable_serialise)
+NUMERIC = ("year", "pmid")
+
+def readLayout(database):
+    #layout stored in an open index, "xappy" for indexes built before layouts existed
+    return database.get_metadata(LAYOUT_KEY) or "xappy"
+
+def checkLayout(layout):
+    if layout not in LAYOUTS:
+        sys.exit("unknown index layout %s - programme terminates" % (layout,))
+    return layout
+
+def readWatermark(path):
+    #id of the last row in tbl_change_log that is contained in the index, None for indexes without watermark
+    watermark = xapian.Database(path).get_metadata(WATERMARK_KEY)
+    if watermark == "":
+        return None
+    return int(watermark)
+
+def writeWatermark(path, watermark):
+    conn = xapian.WritableDatabase(path, xapian.DB_OPEN)
+    conn.set_metadata(WATERMARK_KEY, str(watermark))
+    conn.commit()
+    conn.close()
+
+def compactIndexes(sources, target, renumber = True):
+    #merge several Xapian databases into one with xapian-compact (multipass), as PMC/generate_xapian_compact_command.py
+    #renumber = False keeps the document IDs, the sources have to be given in the order of their document IDs
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    command = ["xapian-compact", "-m"]
+    if not renumber:
+        command.append("--no-renumber")
+    command += list(sources) + [target]
+    print " ".join(command)
+    if subprocess.call(command) != 0:
+        sys.exit("xapian-compact failed - programme terminates")
+
+def _buildShard(args):
+    #index one shard in its own process with its own database connection (used by buildInParallel)
+    indexerClass, xapianPath, directory_name, database, schema, b_year, e_year, b_pmid, e_pmid, shard, shards, batchSize, layout = args
+    from Article import Article
+    indexerClass.showProgress = False
+    Article.getConnection(database, schema)
+    indexer = indexerClass(directory_name, xapianPath = xapianPath, layout = layout)
+    indexer.buildIndexWithArticles(Article.iterArticlesByYear(b_year, e_year, batchSize, b_pmid, e_pmid))
+    Article.closeConnection()
+    print "shard %s of %s indexed" % (shard + 1, shards)
+    return os.path.join(xapianPath, directory_name)
+
+def buildInParallel(indexerClass, path, layout, database, schema, b_year, e_year, ranges, batchSize = None, watermark = None):
+    #index each range of PubMed-IDs (Article.getPMIDRanges) with indexerClass in its own process into a separate
+    #Xapian database and merge the shards into the index path
+    xapianPath, directory_name = os.path.split(path)
+    jobs = []
+    for shard, (b_pmid, e_pmid) in enumerate(ranges):
+        shard_name = "%s_shard%s" % (directory_name, shard)
+        #each shard is built from scratch
+        if os.path.exists(os.path.join(xapianPath, shard_name)):
+            shutil.rmtree(os.path.join(xapianPath, shard_name))
+        jobs.append((indexerClass, xapianPath, shard_name, database, schema, b_year, e_year, b_pmid, e_pmid, shard, len(ranges), batchSize, layout))
+
+    pool = multiprocessing.Pool(len(ranges))
+    shards = pool.map(_buildShard, jobs)
+    pool.close()
+    pool.join()
+
+    #the document IDs of the layout "docid" are PubMed-IDs and must not be renumbered
+    compactIndexes(shards, path, renumber = layout != "docid")
+    for shard in shards:
+        shutil.rmtree(shard)
+
+    if watermark is not None:
+        writeWatermark(path, watermark)
+
+def pageMode(mode, offset, limit):
+    #search mode of a page of results in the QueryCache
+    if offset == 0 and limit == None:
+        return mode
+    return "%s_%s_%s" % (mode, offset, limit)
+
+def limitTime(enquire, seconds):
+    #stop checking further documents after this time (Xapian 1.4 or later, older versions search without a limit)
+    if seconds != None and hasattr(enquire, "set_time_limit"):
+        enquire.set_time_limit(float(seconds))
+
+def limitExpansion(queryParser, terms):
+    #expand each wildcard to the most frequent terms only (Xapian 1.4), older versions raise an error for more terms
+    if hasattr(queryParser, "set_max_expansion"):
+        queryParser.set_max_expansion(terms, xapian.Query.WILDCARD_LIMIT_MOST_FREQUENT)
+    else:
+        queryParser.set_max_wildcard_expansion(terms)
+
+def facetValues(spy, numeric = False):
+    #[value, count] pairs of a ValueCountMatchSpy sorted by value, numbers were stored with sortable_serialise
+    facets = []
+    for item in spy.values():
+        if numeric:
+            facets.append([int(xapian.sortable_unserialise(item.term)), item.termfreq])
+        else:
+            facets.append([item.term, item.termfreq])
+    facets.sort()
+    return facets
+
+def cachedSearch(cache, database, path, mode, query, search, timeLimit = None, shards = None):
+    #result of search() looked up in the QueryCache first (cache None: no cache) - results of searches that ran
+    #into the time limit are not cached, shards are the open databases of a combined database
+    if cache == None:
+        return search()
+    start = time.time()
+    return cache.lookup(database, path, mode, query, search, lambda: timeLimit == None or time.time() - start < timeLimit, shards)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Indexes the same articles with PubMedXapian (xappy) and NativeXapian (Xapian bindings only) and compares the
+    indexing throughput. The articles are loaded from PostgreSQL once before, so only the indexing is measured, e.g.:
+    python benchmark_indexing.py -d pancreatic_cancer_db -b 2010 -e 2015 -t 100000
+"""
+
+import os
+import sys
+import time
+import shutil
+import xapian
+
+from optparse import OptionParser
+
+from Article import Article
+from PubMedXapian import PubMedXapian
+from NativeXapian import NativeXapian
+
+
+def directorySize(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+if __name__=="__main__":
+    parser = OptionParser()
+    parser.add_option("-b", "--b_year", dest="b", help="year of the index to begin parsing (default: 1809)", default=1809)
+    parser.add_option("-e", "--e_year", dest="e", help="year of the index to end parsing (default: 2016)", default=2016)
+    parser.add_option("-d", "--db_psql", dest="d", help="database in PostgreSQL to connect to (default: pancreatic_cancer_db)", default = "pancreatic_cancer_db")
+    parser.add_option("-p", "--xapian_database_path", dest="p", help="directory of the benchmark indexes (default: xapian)", default="xapian")
+    parser.add_option("-l", "--layout", dest="l", help="layout of both indexes, \"xappy\" or \"docid\" (default: xappy)", default = "xappy")
+    parser.add_option("-t", "--flush_threshold", dest="t", help="XAPIAN_FLUSH_THRESHOLD of NativeXapian (default: %s)" % (NativeXapian.flushThreshold,), default = NativeXapian.flushThreshold)
+    parser.add_option("-k", "--keep", dest="k", action="store_true", default=False, help="keep the indexes xapian_benchmark_<class> (default: False)")
+
+    (options, args) = parser.parse_args()
+
+    Article.getConnection(options.d)
+    articles = Article.getArticlesByYear(options.b, options.e)
+    Article.closeConnection()
+    if not articles:
+        sys.exit("no articles found - programme terminates")
+
+    PubMedXapian.showProgress = False
+    NativeXapian.showProgress = False
+    NativeXapian.flushThreshold = int(options.t)
+    results = []
+    for indexerClass in (PubMedXapian, NativeXapian):
+        name = "xapian_benchmark_" + indexerClass.__name__
+        if os.path.exists(os.path.join(options.p, name)):
+            shutil.rmtree(os.path.join(options.p, name))
+
+        start = time.time()
+        indexer = indexerClass(name, xapianPath = options.p, layout = options.l)
+        indexer.buildIndexWithArticles(articles)
+        build_time = time.time() - start
+
+        path = os.path.join(options.p, name)
+        results.append((indexerClass.__name__, build_time, xapian.Database(path).get_doccount(), directorySize(path)))
+        if not options.k:
+            shutil.rmtree(path)
+
+    print "%s articles, years %s to %s, layout %s" % (len(articles), options.b, options.e, options.l)
+    print "indexer\tindexing [s]\tarticles/s\tdocuments\tsize [MB]"
+    for name, build_time, documents, size in results:
+        print "%s\t%.1f\t%.0f\t%s\t%.1f" % (name, build_time, len(articles) / max(build_time, 0.001), documents, size / 1048576.0)
+    print "speed-up of NativeXapian: %.1fx" % (results[0][1] / max(results[1][1], 0.001),)
+    if results[0][2] != results[1][2]:
+        print "warning: the indexes contain a different number of documents"
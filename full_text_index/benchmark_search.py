@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Builds an index from a synthetic corpus (or the articles of PostgreSQL with "-d") and replays the bundled
+    synonym lists, synonym groups, and example queries against it. The latency percentiles (p50, p95, p99), the
+    queries per second, and the size of the index are written as JSON, so the results of different commits,
+    layouts, and indexers can be compared, e.g.:
+    python benchmark_search.py -a 20000 -o benchmark_xappy.json
+    python benchmark_search.py -a 20000 -w -l docid -o benchmark_native_docid.json
+    The synthetic corpus contains the synonyms in the titles and abstracts with a skewed frequency, so there are
+    frequent and rare queries, and it is the same for the same number of articles and seed.
+"""
+
+import os
+import sys
+import math
+import json
+import time
+import random
+import shutil
+import subprocess
+import xapian
+
+from optparse import OptionParser
+
+from Article import Article
+from SynonymParser import readGroups
+
+#vocabulary of the synthetic titles and abstracts
+WORDS = ("patients", "tumor", "cells", "expression", "survival", "treatment", "cancer", "clinical", "analysis", "gene",
+         "protein", "mutation", "carcinoma", "resection", "chemotherapy", "therapy", "study", "results", "risk", "cohort",
+         "pancreatic", "duct", "adenocarcinoma", "pathway", "signaling", "inhibitor", "response", "metastasis", "growth", "factor",
+         "receptor", "tissue", "serum", "marker", "diagnosis", "prognosis", "stage", "trial", "dose", "toxicity",
+         "median", "months", "increased", "decreased", "associated", "significant", "compared", "group", "model", "mice",
+         "human", "lines", "apoptosis", "proliferation", "invasion", "surgery", "imaging", "biopsy", "chronic", "pancreatitis")
+JOURNALS = (("Pancreas", "United States"), ("Gastroenterology", "United States"), ("Br J Cancer", "England"),
+            ("Int J Cancer", "United States"), ("Pancreatology", "Switzerland"), ("Ann Surg Oncol", "United States"))
+MESH = ("Pancreatic Neoplasms", "Carcinoma, Pancreatic Ductal", "Humans", "Mutation", "Prognosis", "Antineoplastic Agents")
+LANGUAGES = ("eng", "eng", "eng", "ger", "fre")
+
+def directorySize(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+def percentile(values, p):
+    #nearest-rank percentile of sorted values
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(int(math.ceil(p / 100.0 * len(values))) - 1, 0))]
+
+def syntheticArticles(count, synonyms, seed):
+    #articles with random words and synonyms, the synonyms at the beginning of the list are the most frequent ones
+    generator = random.Random(seed)
+    def synonym():
+        rank = int(generator.paretovariate(1.0)) - 1
+        if rank < len(synonyms):
+            return synonyms[rank]
+        return generator.choice(synonyms)
+    def sentence(length, mentions):
+        words = [generator.choice(WORDS) for i in range(length)]
+        for i in range(mentions):
+            words.insert(generator.randint(0, len(words)), synonym())
+        return " ".join(words)
+    for pmid in xrange(1, count + 1):
+        journal, country = generator.choice(JOURNALS)
+        chemicals = [synonym() for i in range(generator.randint(0, 2))]
+        yield Article(pmid,
+                      title       = sentence(10, int(generator.random() < 0.3)).capitalize(),
+                      abstract    = sentence(150, generator.randint(0, 3)).capitalize() if generator.random() < 0.8 else None,
+                      chemicals   = chemicals,
+                      keywords    = [generator.choice(WORDS) for i in range(generator.randint(0, 4))],
+                      mesh        = generator.sample(MESH, generator.randint(1, 3)),
+                      year        = generator.randint(1990, 2016),
+                      journal     = journal,
+                      country     = country,
+                      filterTerms = {"language": [generator.choice(LANGUAGES)]},
+                      load        = False)
+
+def readQueries(path):
+    #queries of a file "<name>\t<query>" as used by run_queries.py
+    return [row.rstrip("\r\n").split("\t", 1)[1] for row in open(path) if "\t" in row and not row.startswith("#")]
+
+def replay(search, queries, repeat):
+    #latencies of all runs after one warm-up run (not measured), the number of results of the last run
+    for query in queries:
+        search(query)
+    latencies = []
+    results = 0
+    start = time.time()
+    for i in range(repeat):
+        results = 0
+        for query in queries:
+            query_start = time.time()
+            found = search(query)
+            latencies.append(1000.0 * (time.time() - query_start))
+            results += found if isinstance(found, int) else len(found)
+    duration = time.time() - start
+    latencies.sort()
+    return {"queries": len(queries), "runs": repeat, "results": results,
+            "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95), "p99_ms": percentile(latencies, 99),
+            "mean_ms": sum(latencies) / max(len(latencies), 1), "qps": len(latencies) / max(duration, 0.000001)}
+
+def gitCommit():
+    try:
+        return subprocess.Popen(["git", "rev-parse", "HEAD"], stdout = subprocess.PIPE, stderr = subprocess.PIPE).communicate()[0].strip() or None
+    except OSError:
+        return None
+
+if __name__=="__main__":
+    parser = OptionParser()
+    parser.add_option("-a", "--articles", dest="a", help="number of articles of the synthetic corpus (default: 20000)", default = 20000)
+    parser.add_option("-S", "--seed", dest="S", help="seed of the synthetic corpus (default: 1)", default = 1)
+    parser.add_option("-d", "--db_psql", dest="d", help="index the articles of this database in PostgreSQL instead of a synthetic corpus (optional)", default = None)
+    parser.add_option("-b", "--b_year", dest="b", help="with \"-d\", year of the articles to begin indexing (default: 2010)", default = 2010)
+    parser.add_option("-e", "--e_year", dest="e", help="with \"-d\", year of the articles to end indexing (default: 2016)", default = 2016)
+    parser.add_option("-n", "--name_xapian_db", dest="n", help="benchmark this existing index instead of building one (optional)", default = None)
+    parser.add_option("-p", "--xapian_database_path", dest="p", help="directory of the indexes (default: xapian)", default="xapian")
+    parser.add_option("-l", "--layout", dest="l", help="layout of the benchmark index, \"xappy\" or \"docid\" (default: xappy)", default = None)
+    parser.add_option("-w", "--native", dest="w", action="store_true", default=False, help="index and search with NativeXapian instead of PubMedXapian (default: False)")
+    parser.add_option("-s", "--synonym_paths", dest="s", help="comma-separated synonym lists, each synonym is one query (default: synonyms/pancreatic_cancer.txt,../PMC/synonyms/synonyms.txt)", default = "synonyms/pancreatic_cancer.txt,../PMC/synonyms/synonyms.txt")
+    parser.add_option("-g", "--groups", dest="g", help="comma-separated files of synonym groups, each group is one query (default: synonyms/pancreatic_cancer_groups.txt)", default = "synonyms/pancreatic_cancer_groups.txt")
+    parser.add_option("-q", "--queries", dest="q", help="comma-separated files of queries in the syntax of the scripts search_*.py, searched with NativeXapian (default: queries/examples.txt)", default = "queries/examples.txt")
+    parser.add_option("-r", "--repeat", dest="r", help="number of measured runs over all queries after one warm-up run (default: 3)", default = 3)
+    parser.add_option("-o", "--output", dest="o", help="JSON file of the results (default: standard output)", default = None)
+    parser.add_option("-k", "--keep", dest="k", action="store_true", default=False, help="keep the index xapian_benchmark_search (default: False)")
+
+    (options, args) = parser.parse_args()
+
+    if options.w:
+        from NativeXapian import NativeXapian as PubMedXapian
+    else:
+        from PubMedXapian import PubMedXapian
+    from NativeXapian import NativeXapian
+    PubMedXapian.showProgress = False
+
+    synonymFiles = [path for path in options.s.split(",") if path]
+    groupFiles = [path for path in options.g.split(",") if path]
+    queryFiles = [path for path in options.q.split(",") if path]
+    for path in synonymFiles + groupFiles + queryFiles:
+        if not os.path.isfile(path):
+            sys.exit("%s not existing - programme terminates" % (path,))
+    synonyms = {}
+    for path in synonymFiles:
+        synonyms[path] = [group for name, group in readGroups(path) if name]
+    groups = dict([(path, [group for name, group in readGroups(path, True)]) for path in groupFiles])
+    queries = dict([(path, readQueries(path)) for path in queryFiles])
+
+    result = {"commit": gitCommit(), "date": time.strftime("%Y-%m-%d %H:%M:%S"), "indexer": PubMedXapian.__name__,
+              "xapian": xapian.version_string(), "repeat": int(options.r), "workloads": {}}
+
+    #build the index or use an existing one
+    name = options.n or "xapian_benchmark_search"
+    path = os.path.join(options.p, name)
+    build_time = None
+    if options.n:
+        if not os.path.isdir(path):
+            sys.exit("xapian files of %s are not existing - programme terminates" % (name,))
+        result["corpus"] = {"source": "index"}
+    else:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        if options.d:
+            Article.getConnection(options.d)
+            articles = Article.iterArticlesByYear(options.b, options.e)
+            result["corpus"] = {"source": options.d, "b_year": int(options.b), "e_year": int(options.e)}
+        else:
+            #all synonyms of the bundled lists occur in the corpus
+            vocabulary = sorted(set(sum(sum(synonyms.values(), []) + sum(groups.values(), []), [])))
+            random.Random(int(options.S)).shuffle(vocabulary)
+            articles = syntheticArticles(int(options.a), vocabulary or ["pancreatic cancer"], int(options.S))
+            result["corpus"] = {"source": "synthetic", "articles": int(options.a), "seed": int(options.S)}
+        start = time.time()
+        PubMedXapian(name, xapianPath = options.p, layout = options.l).buildIndexWithArticles(articles)
+        build_time = time.time() - start
+        if options.d:
+            Article.closeConnection()
+
+    indexer = PubMedXapian(name, xapianPath = options.p, layout = options.l)
+    database = xapian.Database(path)
+    result["index"] = {"name": name, "layout": indexer.getLayout(), "documents": database.get_doccount(),
+                       "size_bytes": directorySize(os.path.realpath(path)), "build_seconds": build_time}
+    database.close()
+
+    #synonyms and groups are searched as by RunXapian.py, ranked, without ranking, and only counted
+    repeat = int(options.r)
+    for path, workload in sorted(synonyms.items()) + sorted(groups.items()):
+        concept = path in groups
+        result["workloads"]["%s ranked" % (path,)] = replay(lambda synonyms: indexer.findPMIDsWithSynonyms(synonyms, concept = concept), workload, repeat)
+        result["workloads"]["%s match" % (path,)] = replay(lambda synonyms: indexer.matchPMIDsWithSynonyms(synonyms, concept = concept), workload, repeat)
+        result["workloads"]["%s count" % (path,)] = replay(lambda synonyms: indexer.countPMIDsWithSynonyms(synonyms, concept = concept), workload, repeat)
+        result["workloads"]["%s anywhere" % (path,)] = replay(lambda synonyms: indexer.findPMIDsWithSynonyms(synonyms, concept = concept, anywhere = True), workload, repeat)
+    indexer.closeSearchConnection()
+    #the query syntax of the scripts search_*.py is parsed by NativeXapian only
+    native = NativeXapian(name, xapianPath = options.p)
+    for path, workload in sorted(queries.items()):
+        result["workloads"]["%s ranked" % (path,)] = replay(lambda query: native.findPMIDs(native.textQuery(query)), workload, repeat)
+        result["workloads"]["%s top100" % (path,)] = replay(lambda query: native.findPMIDs(native.textQuery(query), 0, 100), workload, repeat)
+    native.closeSearchConnection()
+
+    if not options.n and not options.k:
+        shutil.rmtree(path)
+
+    output = json.dumps(result, indent = 2, sort_keys = True)
+    if options.o:
+        outfile = open(options.o, "w")
+        outfile.write(output + "\n")
+        outfile.close()
+        print "results written to %s" % (options.o,)
+    else:
+        print output
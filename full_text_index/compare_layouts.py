@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Builds the same articles into one Xapian index per layout of PubMedXapian ("xappy" and "docid") and compares
+    indexing time, index size, and the search time per synonym (ranked and unranked), e.g.:
+    python compare_layouts.py -d pancreatic_cancer_db -b 2010 -e 2015 -s synonyms/pancreatic_cancer.txt
+"""
+
+import os
+import sys
+import time
+import shutil
+
+from optparse import OptionParser
+
+from Article import Article
+from PubMedXapian import PubMedXapian, LAYOUTS
+
+
+def directorySize(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+def searchTime(indexer, synonyms, ranked, repeat):
+    #best of repeat runs over all synonyms, the first run also warms up the page cache
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for synonym in synonyms:
+            if ranked:
+                indexer.findPMIDsWithSynonyms([synonym])
+            else:
+                indexer.matchPMIDsWithSynonyms([synonym])
+        duration = time.time() - start
+        if best == None or duration < best:
+            best = duration
+    return best
+
+if __name__=="__main__":
+    parser = OptionParser()
+    parser.add_option("-b", "--b_year", dest="b", help="year of the index to begin parsing (default: 1809)", default=1809)
+    parser.add_option("-e", "--e_year", dest="e", help="year of the index to end parsing (default: 2016)", default=2016)
+    parser.add_option("-d", "--db_psql", dest="d", help="database in PostgreSQL to connect to (default: pancreatic_cancer_db)", default = "pancreatic_cancer_db")
+    parser.add_option("-s", "--synoynm_path", dest="s", help="relative path to synonym list (default: synonyms/pancreatic_cancer.txt)", default = "synonyms/pancreatic_cancer.txt")
+    parser.add_option("-p", "--xapian_database_path", dest="p", help="directory of the compared indexes (default: xapian)", default="xapian")
+    parser.add_option("-r", "--repeat", dest="r", help="number of search runs, the fastest one is reported (default: 3)", default = 3)
+    parser.add_option("-k", "--keep", dest="k", action="store_true", default=False, help="keep the indexes xapian_layout_<layout> (default: False)")
+
+    (options, args) = parser.parse_args()
+
+    if not os.path.isfile(options.s):
+        sys.exit("synonym file not existing - programme terminates")
+    synonyms = [row.strip() for row in open(options.s) if row.strip()]
+
+    PubMedXapian.showProgress = False
+    results = []
+    matches = {}
+    for layout in LAYOUTS:
+        name = "xapian_layout_" + layout
+        if os.path.exists(os.path.join(options.p, name)):
+            shutil.rmtree(os.path.join(options.p, name))
+
+        Article.getConnection(options.d)
+        start = time.time()
+        indexer = PubMedXapian(name, xapianPath = options.p, layout = layout)
+        indexer.buildIndexWithArticles(Article.iterArticlesByYear(options.b, options.e))
+        build_time = time.time() - start
+        Article.closeConnection()
+
+        size = directorySize(os.path.join(options.p, name))
+        ranked_time = searchTime(indexer, synonyms, True, int(options.r))
+        match_time = searchTime(indexer, synonyms, False, int(options.r))
+        matches[layout] = [sorted(indexer.matchPMIDsWithSynonyms([synonym])) for synonym in synonyms]
+        indexer.closeSearchConnection()
+        results.append((layout, build_time, size, ranked_time, match_time))
+
+        if not options.k:
+            shutil.rmtree(os.path.join(options.p, name))
+
+    print "%s synonyms, years %s to %s" % (len(synonyms), options.b, options.e)
+    print "layout\tindexing [s]\tsize [MB]\tranked [ms/synonym]\tunranked [ms/synonym]"
+    for layout, build_time, size, ranked_time, match_time in results:
+        print "%s\t%.1f\t%.1f\t%.2f\t%.2f" % (layout, build_time, size / 1048576.0,
+                                              1000.0 * ranked_time / max(len(synonyms), 1), 1000.0 * match_time / max(len(synonyms), 1))
+    if matches["xappy"] != matches["docid"]:
+        print "warning: the layouts return different PubMed-IDs"
@@ -9,6 +9,7 @@
 import psycopg2
 from psycopg2 import extras
 
+import sys
 from optparse import OptionParser
 
 #(dis)connection to psql database
@@ -31,7 +32,7 @@ def get_authors(cursor):
             SELECT 
                 fk_pmid, last_name, fore_name
             FROM 
-                pubmed.tbl_author
+                """+schema+""".tbl_author
             ORDER BY
                 fk_pmid;
         """
@@ -43,10 +44,26 @@ def get_authors(cursor):
     output = cursor.fetchall()
     return output
 
+def get_author_counts(cursor):
+    #pre-aggregated numbers of publications, maintained by PubMedAggregates.py or "PubMedParser.py -a"
+    stmt = """
+            SELECT 
+                last_name, fore_name, publications
+            FROM 
+                """+schema+""".tbl_author_count
+            ORDER BY
+                publications DESC, last_name DESC, fore_name DESC;
+        """
+    cursor.execute(stmt)
+    output = cursor.fetchall()
+    return output
+
 if __name__=="__main__":
     parser = OptionParser()
     parser.add_option("-f", "--file", dest="f", help='name of the output file containing all identified synonyms', default="authors.csv")
     parser.add_option("-d", "--database", dest="d", help='name of the database to connect to', default="pancreatic_cancer_db")
+    parser.add_option("-u", "--subset", dest="u", help='name of a subset created with PubMedSubset.py that is queried instead of the schema pubmed (optional)', default=None)
+    parser.add_option("-a", "--aggregates", dest="a", action="store_true", help='read the numbers of publications from the aggregate table tbl_author_count instead of counting all authors (default: False)', default=False)
     
     (options, args) = parser.parse_args()
     
@@ -59,11 +76,30 @@ if __name__=="__main__":
     postgres_host           = "localhost"
     postgres_port           = "5432"
     postgres_db = options.d
+    #schema of the tables (a subset schema has the same tables)
+    schema = options.u or "pubmed"
 
 
     #connect
     postgres_connection, postgres_cursor = connect_postgresql()
 
+    if options.a:
+        #the aggregate table stores missing names as empty strings - use the same names as below
+        outfile = open("results/" + file_name,"w")
+        for last_name, fore_name, publications in get_author_counts(postgres_cursor):
+            if last_name == "" and fore_name == "":
+                name = "not_selected_collection_name"
+            elif last_name == "":
+                name = "no_last_name, "+fore_name
+            elif fore_name == "":
+                name = last_name+", no_fore_name"
+            else:
+                name = last_name+", "+fore_name
+            outfile.write(name+"\t"+str(publications)+"\n")
+        outfile.close()
+        disconnect_postgresql(postgres_connection, postgres_cursor)
+        sys.exit(0)
+
     #get_authors returns a list of lists (with DictCursor) that consists of [PubMed-ID, last name, fore name]
     publication_list = get_authors(postgres_cursor)
 
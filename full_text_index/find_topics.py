@@ -32,7 +32,7 @@ def get_pmids(cursor):
             SELECT 
                 Distinct On(fk_pmid) fk_pmid
             FROM 
-                pubmed.tbl_author
+                """+schema+""".tbl_author
             WHERE
                 last_name = 'Friess' 
             AND
@@ -53,6 +53,7 @@ if __name__=="__main__":
     parser.add_option("-i", "--input_file", dest="i", help='name of the input file containing all PubMed-IDs and identified synonyms', default="results/pmids_results.csv")
     parser.add_option("-o", "--output_file", dest="o", help='name of the output file containing all PubMed-IDs belonging to a special author', default="results/pmids_results_from_author.csv")
     parser.add_option("-d", "--database", dest="d", help='name of the database to connect to', default="pancreatic_cancer_db")
+    parser.add_option("-u", "--subset", dest="u", help='name of a subset created with PubMedSubset.py that is queried instead of the schema pubmed (optional)', default=None)
     
     (options, args) = parser.parse_args()
     
@@ -66,6 +67,8 @@ if __name__=="__main__":
     postgres_host           = "localhost"
     postgres_port           = "5432"
     postgres_db = options.d
+    #schema of the tables (a subset schema has the same tables)
+    schema = options.u or "pubmed"
 
 
     #connect
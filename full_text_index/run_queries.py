@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+    Copyright (c) 2014, Kersten Doering <kersten.doering@gmail.com>, Christian Senger <der.senger@googlemail.com>
+
+    Searches a file of named queries in the syntax of the scripts search_*.py (AND, OR, NOT, NEAR/n, ADJ/n, phrases
+    in quotes, and field names like "title:erlotinib" or "journal:Pancreas") against one index with several threads
+    and writes one line "<query name>\t<PubMed-ID>\t<rank>" per result (rank 0 is the best match), e.g.:
+    python run_queries.py -i queries/examples.txt -n xapian2016 -j 4 -o query_results.csv
+    The query file contains one query per line as "<name>\t<query>", lines starting with "#" are ignored. The
+    results of each query are written as soon as it is finished (in the order of the query file) and its search
+    time is printed. An output file ending with ".parquet" is written with pyarrow (optional, not needed for CSV).
+"""
+
+import os
+import sys
+import time
+import threading
+import itertools
+
+from multiprocessing.pool import ThreadPool
+from optparse import OptionParser
+
+import xapian
+from NativeXapian import NativeXapian
+
+#connection of the current thread
+_local = threading.local()
+
+def readQueries(path):
+    #list of (name, query) in the order of the file
+    queries = []
+    for number, line in enumerate(open(path), 1):
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.startswith("#"):
+            continue
+        if not "\t" in line:
+            sys.exit("line %s of %s is not \"<name>\\t<query>\" - programme terminates" % (number, path))
+        name, query = line.split("\t", 1)
+        queries.append((name.strip(), query.strip()))
+    return queries
+
+def getIndexer(name, path):
+    #one NativeXapian per thread, Xapian databases must not be shared between threads
+    if not hasattr(_local, "indexer"):
+        _local.indexer = NativeXapian(name, xapianPath = path)
+    return _local.indexer
+
+def runQuery(name, path, query, fields, filters, ranked, limit):
+    #(PubMed-IDs, seconds, error message or None) of one query
+    start = time.time()
+    try:
+        indexer = getIndexer(name, path)
+        xapian_query = indexer.filterQuery(indexer.textQuery(query, fields), **filters)
+        if ranked:
+            pmids = indexer.findPMIDs(xapian_query, 0, limit)
+        else:
+            pmids = indexer.matchPMIDs(xapian_query, 0, limit)
+    except xapian.Error, e:
+        return [], time.time() - start, "%s: %s" % (type(e).__name__, e)
+    return pmids, time.time() - start, None
+
+class CSVWriter():
+
+    def __init__(self, path):
+        self.__outfile = open(path, "w")
+
+    def write(self, name, pmids):
+        for rank, pmid in enumerate(pmids):
+            self.__outfile.write("%s\t%s\t%s\n" % (name, pmid, rank))
+        self.__outfile.flush()
+
+    def close(self):
+        self.__outfile.close()
+
+class ParquetWriter():
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            sys.exit("pyarrow is needed for Parquet files (pip install pyarrow) - programme terminates")
+        self.__pyarrow = pyarrow
+        self.__schema = pyarrow.schema([("query_name", pyarrow.string()), ("pmid", pyarrow.int64()), ("rank", pyarrow.int64())])
+        self.__writer = pyarrow.parquet.ParquetWriter(path, self.__schema)
+
+    def write(self, name, pmids):
+        #one row group per query
+        if not pmids:
+            return
+        table = self.__pyarrow.Table.from_arrays([self.__pyarrow.array([name] * len(pmids), self.__pyarrow.string()),
+                                                  self.__pyarrow.array([int(pmid) for pmid in pmids], self.__pyarrow.int64()),
+                                                  self.__pyarrow.array(range(len(pmids)), self.__pyarrow.int64())],
+                                                 schema = self.__schema)
+        self.__writer.write_table(table)
+
+    def close(self):
+        self.__writer.close()
+
+if __name__=="__main__":
+    parser = OptionParser()
+    parser.add_option("-i", "--queries", dest="i", help="file with one query per line, \"<name>\\t<query>\" (default: queries/examples.txt)", default = "queries/examples.txt")
+    parser.add_option("-p", "--xapian_database_path", dest="p", help="directory of the Xapian full text indexes (default: xapian)", default="xapian")
+    parser.add_option("-n", "--name_xapian_db", dest="n", help="name of the searched index (default: xapian2016)", default = "xapian2016")
+    parser.add_option("-o", "--output", dest="o", help="results file, Parquet if the name ends with \".parquet\" (default: query_results.csv)", default = "query_results.csv")
+    parser.add_option("-j", "--threads", dest="j", help="number of queries searched in parallel (default: 4)", default = 4)
+    parser.add_option("-f", "--fields", dest="f", help="comma-separated fields searched by queries without field names (default: title,text)", default = "title,text")
+    parser.add_option("-y", "--years", dest="y", help="only find articles published in this range of years, e.g. 2005-2010, 2005- or -2010 (optional)", default = None)
+    parser.add_option("-F", "--filter", dest="F", action="append", default=[], help="only find articles with this identifier or metadata, e.g. -F language=eng, as in RunXapian.py (optional)")
+    parser.add_option("-m", "--match_only", dest="m", action="store_true", default=False, help="find the PubMed-IDs without ranking them by relevance, the rank is the order of the PubMed-IDs then (default: False)")
+    parser.add_option("-l", "--limit", dest="l", help="maximum number of PubMed-IDs per query, only these are ranked (default: all matches)", default = None)
+    parser.add_option("-T", "--time_limit", dest="T", help="seconds after which a query returns the best matches found so far - needs Xapian 1.4 (optional)", default = None)
+
+    (options, args) = parser.parse_args()
+
+    if not os.path.isfile(options.i):
+        sys.exit("query file not existing - programme terminates")
+    if not os.path.isdir(os.path.join(options.p, options.n)):
+        sys.exit("xapian files of %s are not existing - programme terminates" % (options.n,))
+    queries = readQueries(options.i)
+
+    filters = {"terms": {}}
+    if options.y:
+        years = options.y.split("-")
+        if len(years) != 2:
+            sys.exit("use \"-y <begin>-<end>\" to restrict the range of years - programme terminates")
+        filters["b_year"] = int(years[0]) if years[0] else None
+        filters["e_year"] = int(years[1]) if years[1] else None
+    for term in options.F:
+        if not "=" in term:
+            sys.exit("use \"-F <field>=<value>\" to filter the articles - programme terminates")
+        field, value = term.split("=", 1)
+        filters["terms"].setdefault(field.strip(), []).append(value.strip())
+    try:
+        NativeXapian(options.n, xapianPath = options.p).checkFilterTerms(filters["terms"])
+    except ValueError, e:
+        sys.exit("%s - programme terminates" % (e,))
+    fields = [name.strip() for name in options.f.split(",") if name.strip()]
+    limit = int(options.l) if options.l else None
+    if options.T:
+        NativeXapian.timeLimit = float(options.T)
+
+    if options.o.endswith(".parquet"):
+        writer = ParquetWriter(options.o)
+    else:
+        writer = CSVWriter(options.o)
+    #imap returns the results in the order of the query file while the next queries are still searched
+    pool = ThreadPool(max(int(options.j), 1))
+    start = time.time()
+    results = pool.imap(lambda item: runQuery(options.n, options.p, item[1], fields, filters, not options.m, limit), queries)
+    print "query\tresults\ttime [ms]"
+    failed = 0
+    for (name, query), (pmids, seconds, error) in itertools.izip(queries, results):
+        if error != None:
+            failed += 1
+            print "%s\t-\t%.1f\t%s" % (name, 1000 * seconds, error)
+            continue
+        writer.write(name, pmids)
+        print "%s\t%s\t%.1f" % (name, len(pmids), 1000 * seconds)
+    pool.close()
+    pool.join()
+    writer.close()
+    print "%s queries in %.1f s, results written to %s" % (len(queries), time.time() - start, options.o)
+    if failed:
+        sys.exit("%s queries failed" % (failed,))
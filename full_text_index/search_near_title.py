@@ -11,6 +11,15 @@ import xappy
 searchConn = xappy.SearchConnection("xapian/xapian2015")
 searchConn.reopen()
 
+#restrict the results to a range of publication years, e.g. b_year = 2005 and e_year = 2010 (None: no restriction)
+#the index needs to be built with the field "year" (RunXapian.py -x)
+b_year = None
+e_year = None
+
+#only one page of page_size results is ranked and loaded from the index, e.g. page = 1 for the ranks 1000 to 1999
+page = 0
+page_size = 1000
+
 #########################
 
 querystring1 = "pancreatic cancer"
@@ -33,8 +42,11 @@ title_q = searchConn.query_field('title', title)
 
 print "search query: ", title_q
 
-#save all machting documents in "results" (starting with rank 0 - check help documentation of function "search")
-results = searchConn.search(title_q, 0, searchConn.get_doccount())
+if b_year != None or e_year != None:
+    title_q = searchConn.query_filter(title_q, searchConn.query_range('year', b_year, e_year))
+
+#save the matching documents of the page in "results" (starting with rank page * page_size - check help documentation of function "search")
+results = searchConn.search(title_q, page * page_size, (page + 1) * page_size)
 
 print "number of matches: ", results.matches_estimated
 ### debug: ###
@@ -76,11 +88,9 @@ end_string = """
 #write header
 outfile.write(start_string)
 print "### save results in Xapian_query_results_NEAR.html ###"
-#write the first 1000 PubMed-IDs and titles with term "pancreatic" or stem "pancreat"
+#write the PubMed-IDs and titles of the page with term "pancreatic" or stem "pancreat"
 for index,result in enumerate(results):
-        outfile.write("<tr><td>" + str(index) + "</td><td>" + result.id + "</td><td>" + results.get_hit(index).highlight('title')[0] +"</td></tr>")
-#        if index == 999:
-#            break
+        outfile.write("<tr><td>" + str(result.rank) + "</td><td>" + result.id + "</td><td>" + results.get_hit(index).highlight('title')[0] +"</td></tr>")
 
 #write string for finishing HTML document
 outfile.write(end_string)
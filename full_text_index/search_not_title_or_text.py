@@ -12,6 +12,15 @@ import xappy
 conn = xappy.SearchConnection("xapian/xapian2015")
 conn.reopen()
 
+#restrict the results to a range of publication years, e.g. b_year = 2005 and e_year = 2010 (None: no restriction)
+#the index needs to be built with the field "year" (RunXapian.py -x)
+b_year = None
+e_year = None
+
+#only one page of page_size results is ranked and loaded from the index, e.g. page = 1 for the ranks 1000 to 1999
+page = 0
+page_size = 1000
+
 
 queryString = "pancreatic colon lung ovarian"
 
@@ -41,8 +50,11 @@ text_q = conn.query_field('text', text)
 merged_q = conn.query_composite(conn.OP_OR, [title_q, text_q])
 print "merged search query: ", merged_q
 
-#save all machting documents in "results" (starting with rank 0 - check help documentation of function "search")
-results = conn.search(merged_q, 0, conn.get_doccount())
+if b_year != None or e_year != None:
+    merged_q = conn.query_filter(merged_q, conn.query_range('year', b_year, e_year))
+
+#save the matching documents of the page in "results" (starting with rank page * page_size - check help documentation of function "search")
+results = conn.search(merged_q, page * page_size, (page + 1) * page_size)
 
 print "number of matches: ", results.matches_estimated
 
@@ -88,14 +100,12 @@ end_string = """
 #write header
 outfile.write(start_string)
 print "### save results in Xapian_query_results_NOT.html ###"
-#write the first 1000 PubMed-IDs and titles with term "pancreatic" or stem "pancreat"
+#write the PubMed-IDs and titles of the page with term "pancreatic" or stem "pancreat"
 for index,result in enumerate(results):
         try:
-            outfile.write("<tr><td>" + str(index) + "</td><td>" + result.id + "</td><td>" + results.get_hit(index).highlight('title')[0] +"</td><td>" + results.get_hit(index).highlight('text')[0] + "</td></tr>")
+            outfile.write("<tr><td>" + str(result.rank) + "</td><td>" + result.id + "</td><td>" + results.get_hit(index).highlight('title')[0] +"</td><td>" + results.get_hit(index).highlight('text')[0] + "</td></tr>")
         except:
-            outfile.write("<tr><td>" + str(index) + "</td><td>" + result.id + "</td><td>" + results.get_hit(index).highlight('title')[0] +"</td><td>" + "<i>no abstract</i>" + "</td></tr>")
-#        if index > 1000:
-#            break
+            outfile.write("<tr><td>" + str(result.rank) + "</td><td>" + result.id + "</td><td>" + results.get_hit(index).highlight('title')[0] +"</td><td>" + "<i>no abstract</i>" + "</td></tr>")
 
 #write string for finishing HTML document
 outfile.write(end_string)
@@ -5,22 +5,39 @@
 """
 
 import xappy
+import xapian
 import sys
 import os
 
 from SynonymParser import SynonymParser
-from Article import Article
+from Article import Article, FILTER_FIELDS
+from XapianTools import LAYOUT_KEY, LAYOUTS, WATERMARK_KEY, NUMERIC, readLayout, checkLayout, readWatermark, buildInParallel, \
+                        pageMode, limitTime, limitExpansion, facetValues, cachedSearch
 
 class PubMedXapian():
     __indexCount  = 0
     __indexMsg    = ""
+    #print the number of indexed articles on the command-line
+    showProgress  = True
+    #QueryCache for the results of searches, e.g. PubMedXapian.cache = QueryCache("cache") (None: no cache)
+    cache         = None
+    #seconds after which a search stops checking further documents and returns the best matches found so far
+    #(Enquire.set_time_limit of Xapian 1.4, None: no limit) - results of searches that took so long are not cached
+    timeLimit     = None
+    #maximum number of terms a wildcard in anywhereQuery (e.g. "pancrea*") expands to, the most frequent ones are used
+    maxExpansion  = 1000
+    #maximum number of synonyms searched with one query, more synonyms raise a ValueError (None: no limit)
+    maxSynonyms   = None
 
     def __init__(   self,
                     directory_name,
                     #no absolut path
                     xapianPath = "xapian",
+                    #None: layout of the existing index, "xappy" for new indexes
+                    layout = None,
                  ):
         self.__xapianPath   = os.path.join( xapianPath, directory_name )
+        self.__layout       = layout
         self.__pmids        = []
         self.__searchConn   = None 
 
@@ -46,10 +63,57 @@ class PubMedXapian():
 #        for mesh in article.getMeSH():
 #            doc.fields.append(xappy.Field("mesh", mesh))
 
-        doc.id = str(article.getPMID())
+        #filter fields: the year as value slot for range queries, journal and country as exact terms
+        if article.getYear() != None:
+            doc.fields.append(xappy.Field("year", str(article.getYear())))
+        if article.getJournal():
+            doc.fields.append(xappy.Field("journal", article.getJournal()))
+        if article.getCountry():
+            doc.fields.append(xappy.Field("country", article.getCountry()))
+
+        #identifiers and metadata as boolean filter terms (see filterQuery), exact terms have a maximum length
+        for field in FILTER_FIELDS:
+            for value in article.getFilterTerms().get(field, []):
+                if len(value) < 219:
+                    doc.fields.append(xappy.Field(field, value))
+
+        #the PubMed-ID as value slot, so matchPMIDsWithSynonyms does not need to load documents
+        #(not needed in the layout "docid", where the PubMed-ID is the document ID)
+        if self.getLayout() == "xappy":
+            doc.fields.append(xappy.Field("pmid", str(article.getPMID())))
+            doc.id = str(article.getPMID())
         return doc
 
-    def buildIndexWithArticles(self, articles):
+    def __addDocument(self, conn, article, replace = False):
+        doc = self.__buildDoc(article)
+        if doc == None: return False
+        if self.getLayout() == "docid":
+            #replace_document creates the document with this ID if it does not exist
+            conn._index.replace_document(article.getPMID(), conn.process(doc).prepare())
+        elif replace:
+            conn.replace(doc)
+        else:
+            conn.add(doc)
+        return True
+
+    def __deleteDocument(self, conn, pmid):
+        if self.getLayout() == "docid":
+            try:
+                conn._index.delete_document(int(pmid))
+            except xapian.DocNotFoundError:
+                pass
+        else:
+            conn.delete(str(pmid))
+
+    def getLayout(self):
+        if self.__layout == None:
+            self.__layout = "xappy"
+            if os.path.isdir(self.__xapianPath):
+                self.__layout = readLayout(xapian.Database(self.__xapianPath))
+        return checkLayout(self.__layout)
+
+    def __openIndexer(self):
+        new = not os.path.isdir(self.__xapianPath)
         conn = xappy.IndexerConnection(self.__xapianPath)
 
         #add priority to title field in case of ranked matching (weight=5)- index all fields and store data
@@ -60,38 +124,174 @@ class PubMedXapian():
 #        conn.add_field_action('keyword', xappy.FieldActions.INDEX_FREETEXT, language='en')
 #        conn.add_field_action('mesh', xappy.FieldActions.INDEX_FREETEXT, language='en')
 
-        conn.add_field_action('text', xappy.FieldActions.STORE_CONTENT)
-        conn.add_field_action('title', xappy.FieldActions.STORE_CONTENT)
-        # not used in title_text version
-#        conn.add_field_action('chemical_exact', xappy.FieldActions.STORE_CONTENT)
-#        conn.add_field_action('keyword', xappy.FieldActions.STORE_CONTENT)
-#        conn.add_field_action('mesh', xappy.FieldActions.STORE_CONTENT)
+        #the layout "docid" does not store any field contents, the articles can be loaded from PostgreSQL
+        if self.getLayout() == "xappy":
+            conn.add_field_action('text', xappy.FieldActions.STORE_CONTENT)
+            conn.add_field_action('title', xappy.FieldActions.STORE_CONTENT)
+            # not used in title_text version
+#            conn.add_field_action('chemical_exact', xappy.FieldActions.STORE_CONTENT)
+#            conn.add_field_action('keyword', xappy.FieldActions.STORE_CONTENT)
+#            conn.add_field_action('mesh', xappy.FieldActions.STORE_CONTENT)
+
+        #one index serves all ranges of years - see findPMIDsWithSynonyms
+        conn.add_field_action('year', xappy.FieldActions.SORTABLE, type='float')
+        conn.add_field_action('journal', xappy.FieldActions.INDEX_EXACT)
+        conn.add_field_action('country', xappy.FieldActions.INDEX_EXACT)
+        conn.add_field_action('pmid', xappy.FieldActions.SORTABLE, type='float')
+        #journal and country also as value slots for facet counts (see facetCountsWithSynonyms) - not added to older
+        #indexes, where only the articles of incremental updates would have them
+        if new or self.__hasSlot(conn, 'journal'):
+            conn.add_field_action('journal', xappy.FieldActions.SORTABLE)
+            conn.add_field_action('country', xappy.FieldActions.SORTABLE)
+        #boolean filter terms (see filterQuery), also only in new indexes
+        if new or self.__hasPrefix(conn, FILTER_FIELDS[0]):
+            for field in FILTER_FIELDS:
+                conn.add_field_action(field, xappy.FieldActions.INDEX_EXACT)
+        conn.set_metadata(LAYOUT_KEY, self.getLayout())
+        return conn
+
+    def __hasPrefix(self, conn, field):
+        try:
+            conn._field_mappings.get_prefix(field)
+            return True
+        except KeyError:
+            return False
+
+    def __hasSlot(self, conn, field):
+        try:
+            conn._field_mappings.get_slot(field, 'collsort')
+            return True
+        except KeyError:
+            return False
+
+    def buildIndexWithArticles(self, articles, watermark = None):
+        #watermark is the id of the last row in tbl_change_log covered by the articles (see updateIndexWithArticles)
+        conn = self.__openIndexer()
 
         for article in articles:
-            doc = self.__buildDoc(article)
-            if doc == None: continue
             try:
-                #process doc to pdoc explicitly - not needed here
-                #pdoc = conn.process(doc)
-                conn.add(doc)
+                if not self.__addDocument(conn, article): continue
             except:
                 continue
 
             PubMedXapian.__indexCount += 1
+            if not PubMedXapian.showProgress: continue
             nbs = len(PubMedXapian.__indexMsg)
             PubMedXapian.__indexMsg  = "article %s indexed" % (str(PubMedXapian.__indexCount))
             sys.stdout.write('\b' * nbs + PubMedXapian.__indexMsg)
+        if watermark is not None:
+            conn.set_metadata(WATERMARK_KEY, str(watermark))
         conn.flush()
         conn.close()
 
-    def findPMIDsWithSynonyms(self, synonyms):
+    def getWatermark(self):
+        #id of the last row in tbl_change_log that is contained in the index, None for indexes without watermark
+        return readWatermark(self.__xapianPath)
+
+    def updateIndexWithArticles(self, articles, pmids, watermark):
+        #incremental update: remove all changed PubMed-IDs (inserted or deleted since the last watermark) from the
+        #index, add the articles that exist now, and store the new watermark - the cost depends on the number of changes
+        conn = self.__openIndexer()
+        for pmid in pmids:
+            self.__deleteDocument(conn, pmid)
+        updated = 0
+        for article in articles:
+            try:
+                if not self.__addDocument(conn, article, replace = True): continue
+            except:
+                continue
+            updated += 1
+        conn.set_metadata(WATERMARK_KEY, str(watermark))
+        conn.flush()
+        conn.close()
+        return updated
+
+    def buildIndexInParallel(self, database, schema, b_year, e_year, ranges, batchSize = None, watermark = None):
+        #index each range of PubMed-IDs (Article.getPMIDRanges) in its own process into a separate Xapian
+        #database and merge the shards into the full text index of this instance
+        if not ranges:
+            return self.buildIndexWithArticles([], watermark)
+        buildInParallel(PubMedXapian, self.__xapianPath, self.getLayout(), database, schema, b_year, e_year, ranges, batchSize, watermark)
+
+    def getSearchConnection(self):
         if self.__searchConn == None:
             self.__searchConn = xappy.SearchConnection(self.__xapianPath)
             self.__searchConn.reopen()
+        return self.__searchConn
+
+    def closeSearchConnection(self):
+        #the connection is opened again by the next search, e.g. in a forked worker process
+        if self.__searchConn != None:
+            self.__searchConn.close()
+            self.__searchConn = None
+
+    def checkFilterTerms(self, terms):
+        #an unknown field or a field the index was built without would filter out all articles without notice
+        self.getSearchConnection()
+        for field in sorted(terms or {}):
+            if field not in FILTER_FIELDS:
+                raise ValueError("unknown filter field %s - use %s" % (field, ", ".join(FILTER_FIELDS)))
+            if not self.__hasPrefix(self.__searchConn, field):
+                raise ValueError("the index was built without the filter field %s - build it again with RunXapian.py -x" % (field,))
 
-        xapian_querys = []
+    def filterQuery(self, query, b_year = None, e_year = None, journal = None, country = None, terms = None):
+        #restrict a query to a range of publication years (inclusive, open-ended if one year is None), a journal
+        #(MEDLINE abbreviation, e.g. "Pancreas"), and a country - indexes built before these fields existed
+        #do not contain them, so filtering them returns no results
+        self.getSearchConnection()
+        filters = []
+        if b_year != None or e_year != None:
+            filters.append( self.__searchConn.query_range('year', b_year, e_year) )
+        if journal:
+            filters.append( self.__searchConn.query_field('journal', journal) )
+        if country:
+            filters.append( self.__searchConn.query_field('country', country) )
+        #boolean filter terms: field of FILTER_FIELDS -> value or list of values, e.g. {"mesh_ui": ["D010190", "D002289"],
+        #"author": "friess h"} - the values of a field are combined with OR, all filters with AND
+        self.checkFilterTerms(terms)
+        for field, values in sorted((terms or {}).items()):
+            if isinstance(values, basestring):
+                values = [values]
+            if field == 'author':
+                #author keys are indexed in lowercase
+                values = [value.lower() for value in values]
+            filters.append( self.__searchConn.query_composite(self.__searchConn.OP_OR, [self.__searchConn.query_field(field, value) for value in values]) )
+        if not filters:
+            return query
+        return self.__searchConn.query_filter(query, self.__searchConn.query_composite(self.__searchConn.OP_AND, filters))
+
+    def anywhereQuery(self, querystring):
+        #query for the unprefixed terms, which xappy indexes for all free text fields (title and text) in addition
+        #to the prefixed ones
+        queryParser = xapian.QueryParser()
+        queryParser.set_stemmer(xapian.Stem('en'))
+        queryParser.set_stemming_strategy(xapian.QueryParser.STEM_SOME)
+        queryParser.set_default_op(xapian.Query.OP_AND)
+        #wildcards are expanded with the terms of the index
+        queryParser.set_database(self.getSearchConnection()._index)
+        limitExpansion(queryParser, PubMedXapian.maxExpansion)
+        flags = xapian.QueryParser.FLAG_LOVEHATE | xapian.QueryParser.FLAG_PHRASE | xapian.QueryParser.FLAG_BOOLEAN | xapian.QueryParser.FLAG_WILDCARD
+        try:
+            return queryParser.parse_query(querystring, flags)
+        except xapian.QueryParserError:
+            return queryParser.parse_query(querystring, flags & ~xapian.QueryParser.FLAG_BOOLEAN)
+
+    def synonymQuery(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None):
+        #phrase query for each synonym in all fields, combined with OR and restricted by the filters
+        #concept = True: the synonyms are one group (see SynonymParser.py), combined with OP_SYNONYM instead of OR
+        #anywhere = True: each synonym is searched in all fields with one query (see anywhereQuery)
+        self.getSearchConnection()
+        if PubMedXapian.maxSynonyms != None and len(synonyms) > PubMedXapian.maxSynonyms:
+            raise ValueError("%s synonyms are more than %s synonyms per query" % (len(synonyms), PubMedXapian.maxSynonyms))
+
+        synonym_querys = []
 
         for querystring in synonyms:
+            if anywhere:
+                #one phrase query instead of one per field - the posting lists of the terms are read once
+                synonym_querys.append( self.anywhereQuery('"' + querystring + '"') )
+                continue
+            xapian_querys = []
             # not used in title_text version
 #            title, text, keyword, chemical_exact, mesh = '"' + querystring + '"', '"' + querystring + '"', '"' + querystring + '"', '"' + querystring + '"', '"' + querystring + '"'
             title, text = '"' + querystring + '"', '"' + querystring + '"'
@@ -103,9 +303,94 @@ class PubMedXapian():
 #            xapian_querys.append( self.__searchConn.query_field('keyword', keyword) )
 #            xapian_querys.append( self.__searchConn.query_field('chemical_exact', chemical_exact) )
 #            xapian_querys.append( self.__searchConn.query_field('mesh', mesh) )
+            synonym_querys.append( self.__searchConn.query_composite(self.__searchConn.OP_OR, xapian_querys) )
+
+        if concept:
+            #all synonyms of one concept: OP_SYNONYM weights their matches like a single term, so the group is
+            #searched in one pass and documents containing several synonyms are not ranked higher
+            merged_q = xapian.Query(xapian.Query.OP_SYNONYM, synonym_querys)
+        else:
+            merged_q = self.__searchConn.query_composite(self.__searchConn.OP_OR, synonym_querys)
+        return self.filterQuery(merged_q, b_year, e_year, journal, country, terms)
+
+    def findPMIDsWithSynonyms(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None, offset = 0, limit = None):
+        #ranked search, PubMed-IDs are sorted by relevance - offset and limit return one page of the ranking, only
+        #the best offset + limit documents are sorted (None: all matches)
+        merged_q = self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms)
+        return self.__cached(pageMode("ranked", offset, limit), merged_q, lambda: self.__findPMIDs(merged_q, offset, limit))
+
+    def __cached(self, mode, query, search):
+        #results are looked up in PubMedXapian.cache (a QueryCache) first, if it is set
+        return cachedSearch(PubMedXapian.cache, self.__searchConn._index, self.__xapianPath, mode, query, search, PubMedXapian.timeLimit)
+
+    def __enquire(self, query):
+        enquire = xapian.Enquire(self.__searchConn._index)
+        enquire.set_query(query)
+        limitTime(enquire, PubMedXapian.timeLimit)
+        return enquire
+
+    def __findPMIDs(self, merged_q, offset = 0, limit = None):
+        #the same ranking as xappy's search(), but only the PubMed-IDs are read and the time limit is applied
+        if limit == None:
+            limit = self.__searchConn.get_doccount()
+        return self.__msetPMIDs(self.__enquire(merged_q).get_mset(offset, limit))
+
+    def __matchSet(self, query, maxitems, check_at_least = None, spy = None, first = 0):
+        #unranked match: boolean weighting skips the BM25 calculation and documents are returned in docid order
+        #(all matches are checked and seen by the match spy, if check_at_least is not given)
+        enquire = self.__enquire(query)
+        enquire.set_weighting_scheme(xapian.BoolWeight())
+        enquire.set_docid_order(xapian.Enquire.ASCENDING)
+        if spy != None:
+            enquire.add_matchspy(spy)
+        if check_at_least == None:
+            check_at_least = self.__searchConn.get_doccount()
+        return enquire.get_mset(first, maxitems, check_at_least)
+
+    def matchPMIDsWithSynonyms(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None, offset = 0, limit = None):
+        #set of matching PubMed-IDs without ranking and without loading the stored document data
+        merged_q = self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms)
+        return self.__cached(pageMode("match", offset, limit), merged_q, lambda: self.__matchPMIDs(merged_q, offset, limit))
+
+    def __matchPMIDs(self, merged_q, offset = 0, limit = None):
+        if limit == None:
+            limit = self.__searchConn.get_doccount()
+        return self.__msetPMIDs(self.__matchSet(merged_q, limit, first = offset))
+
+    def __msetPMIDs(self, mset):
+        if self.getLayout() == "docid":
+            return [str(match.docid) for match in mset]
+        try:
+            #indexes built with the value slot "pmid" - only the value is read
+            slot = self.__searchConn._field_mappings.get_slot('pmid', 'collsort')
+            return [str(int(xapian.sortable_unserialise(match.document.get_value(slot)))) for match in mset]
+        except KeyError:
+            #older indexes: read the unique ID term (prefix "Q") from the term list of each document
+            pmids = []
+            for match in mset:
+                terms = self.__searchConn._index.termlist(match.docid)
+                term = terms.skip_to('Q').term
+                pmids.append(term[1:])
+            return pmids
 
-        merged_q = self.__searchConn.query_composite(self.__searchConn.OP_OR, xapian_querys)
-        results=self.__searchConn.search(merged_q, 0, self.__searchConn.get_doccount())
+    def countPMIDsWithSynonyms(self, synonyms, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None, check_at_least = None):
+        #number of matching documents, no document is returned at all - with check_at_least, the count is exact up
+        #to this number and a lower bound otherwise, which is faster for frequent synonyms
+        merged_q = self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms)
+        if check_at_least == None:
+            return self.__cached("count", merged_q, lambda: self.__matchSet(merged_q, 0).get_matches_estimated())
+        return self.__cached("count%s" % (check_at_least,), merged_q, lambda: self.__matchSet(merged_q, 0, int(check_at_least)).get_matches_lower_bound())
 
-        return [r.id for r in results] 
+    def facetCountsWithSynonyms(self, synonyms, field, b_year = None, e_year = None, journal = None, country = None, concept = False, anywhere = False, terms = None):
+        #number of matching documents per value of the field ("year", "journal", or "country") as sorted list of
+        #[value, count], e.g. the publication timeline of a synonym with one query - no document is returned at all
+        merged_q = self.synonymQuery(synonyms, b_year, e_year, journal, country, concept, anywhere, terms)
+        return self.__cached("facet_" + field, merged_q, lambda: self.__facetCounts(merged_q, field))
 
+    def __facetCounts(self, merged_q, field):
+        #indexes built before the journal and country were stored in value slots do not have facets
+        if not self.__hasSlot(self.__searchConn, field):
+            return []
+        spy = xapian.ValueCountMatchSpy(self.__searchConn._field_mappings.get_slot(field, 'collsort'))
+        self.__matchSet(merged_q, 0, spy = spy)
+        return facetValues(spy, field in NUMERIC)
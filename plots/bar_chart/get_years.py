@@ -4,6 +4,7 @@
     Copyright (c) 2015, Kersten Doering <kersten.doering@gmail.com>
 
     This script connects to a PostgreSQL database and selects all publication years given for a list of PubMed-IDs. The PubMed-IDs are provided by the search on the Xapian full text index for the pancreatic cancer data set. The output contains three CSV files that can be used to create a timeline for the search terms by using the script create_bar_chart.py.
+    With the parameter -n, the publication years are counted in the Xapian full text index instead, with one facet query per search term and without PostgreSQL and the results of RunXapian.py.
 """
 
 #Kersten Doering 11.06.2014
@@ -14,26 +15,31 @@ import psycopg2
 from psycopg2 import extras
 # to join paths
 import os
+# to import PubMedXapian from the Xapian directory
+import sys
 # to use command-line parameters
 from optparse import OptionParser
 # to count occurrences of an Integer in a list: http://stackoverflow.com/questions/2600191/how-can-i-count-the-occurrences-of-a-list-item-in-python
 from collections import Counter
 
-# join abstract title and text for a given PubMed-ID "pmid" and return the triple as a list [PubMed-ID, title, text]
-def get_year(pmid):
+# count the publication years of a list of PubMed-IDs in one query and return a list of [year, count]
+def get_year_counts(pmids):
     stmt = """
             SELECT 
-                pub_date_year
+                pub_date_year, count(*)
             FROM 
-                pubmed.tbl_journal
+                """+schema+""".tbl_journal
             WHERE
-                fk_pmid = %s
+                fk_pmid = ANY(%s)
+                    AND
+                pub_date_year IS NOT NULL
+            GROUP BY
+                pub_date_year
         """
         
-    cursor.execute(stmt, (pmid,))
+    cursor.execute(stmt, ([int(pmid) for pmid in pmids],))
     
-    year = cursor.fetchone()
-    return year
+    return cursor.fetchall()
 
 # main
 if __name__=="__main__":
@@ -43,17 +49,10 @@ if __name__=="__main__":
     parser.add_option("-p", "--pmids_input", dest="p", help='name of the input file that contains all PubMed-IDs for the search term', default="results/results.csv")
     parser.add_option("-t", "--terms_input", dest="t", help='name of the input file that contains all search terms that should be shown in the bar chart', default="search_terms.txt")
     parser.add_option("-o", "--output_folder",dest="o",help='name of the output directory (optional, default: ""', default="")
+    parser.add_option("-u", "--subset", dest="u", help='name of a subset created with PubMedSubset.py that is queried instead of the schema pubmed (optional)', default=None)
+    parser.add_option("-n", "--name_xapian_db", dest="n", help='name of a Xapian index in the directory "xapian" of the Xapian path - count the years of each search term in the index instead of PostgreSQL (optional, e.g. xapian2016)', default=None)
     (options, args) = parser.parse_args()
 
-    # settings for psql connection
-    postgres_user       = "parser"
-    postgres_password   = "parser"
-    postgres_host       = "localhost" 
-    postgres_port       = "5432"
-    postgres_db         = options.d
-    connection          = psycopg2.connect("dbname='"+postgres_db+"' user='"+postgres_user+"' host='"+postgres_host+"' password='"+postgres_password+"' port='"+postgres_port+"'")
-    cursor              = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
     # save file paths in an extra variable
     pmids_input         = options.p
     terms_input         = options.t
@@ -66,28 +65,50 @@ if __name__=="__main__":
     infile = open(terms_input,"r")
     for line in infile:
         search_terms[line.strip()] = []
-        years[line.strip()] = []
+        years[line.strip()] = Counter()
     infile.close()
 
+    # count the years of each search term with one facet query on the value slot "year" of the full text index
+    if options.n:
+        sys.path.insert(0, xapian_path)
+        from PubMedXapian import PubMedXapian
+        indexer = PubMedXapian(options.n, xapianPath = os.path.join(xapian_path, "xapian"))
+        for search_term in search_terms:
+            for year, count in indexer.facetCountsWithSynonyms([search_term], "year"):
+                years[search_term][int(year)] += count
+        indexer.closeSearchConnection()
+
+    # settings for psql connection
+    postgres_user       = "parser"
+    postgres_password   = "parser"
+    postgres_host       = "localhost" 
+    postgres_port       = "5432"
+    postgres_db         = options.d
+    # PostgreSQL is not needed for counting in the full text index
+    if not options.n:
+        connection      = psycopg2.connect("dbname='"+postgres_db+"' user='"+postgres_user+"' host='"+postgres_host+"' password='"+postgres_password+"' port='"+postgres_port+"'")
+        cursor          = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    # schema of the tables (a subset schema has the same tables)
+    schema              = options.u or "pubmed"
+
     # results from RunXapian.py - save PubMed-IDs for each search term in a list of pmids:
-    infile = open(os.path.join(xapian_path, pmids_input),"r")
-    for line in infile:
-        temp_line = line.strip().split("\t")
-        if temp_line[-1] in search_terms:
-            search_terms[temp_line[-1]].append(temp_line[0])
-    infile.close()
+    if not options.n:
+        infile = open(os.path.join(xapian_path, pmids_input),"r")
+        for line in infile:
+            temp_line = line.strip().split("\t")
+            if temp_line[-1] in search_terms:
+                search_terms[temp_line[-1]].append(temp_line[0])
+        infile.close()
 
-    # get all years for each search term
+    # count all years for each search term with one query per search term instead of one query per PubMed-ID
     for search_term, pmids in search_terms.items():
-        for pmid in pmids:
-            year = get_year(pmid)
-            if year:
-                years[search_term].append(int(year[0]))
+        if pmids:
+            for year, count in get_year_counts(pmids):
+                years[search_term][int(year)] += count
 
-    # count years and save the numbers in a CSV file named with the gene name
-    for search_term, year_list in years.items():
-        # use module collections with Counter() to generate a dictionary with the key year and the amount of years as value
-        counts = Counter(year_list)
+    # save the numbers in a CSV file named with the gene name
+    for search_term, counts in years.items():
+        # counts is a Counter() - a dictionary with the key year and the amount of years as value
         # sort list of appearing years
         temp_years = counts.keys()
         temp_years.sort(reverse=True)
@@ -13,18 +13,31 @@ import matplotlib.pyplot as plt
 """
 SQL command to get data (this entry is not set for every PubMed-ID) - this data set is based on the download of XML files from 16th April 2015 (23258 PubMed-IDs):
 \copy (select fk_pmid, lower(country) from pubmed.tbl_medline_journal_info where country is not null order by country asc) to 'countries_pancreatic_cancer.csv' delimiter ','
+
+If the aggregate tables are maintained (PubMedAggregates.py or "PubMedParser.py -a"), the pre-counted publications per country can be used instead - set aggregated = True:
+\copy (select lower(country), sum(publications) from pubmed.tbl_country_count group by lower(country) order by lower(country) asc) to 'countries_pancreatic_cancer_aggregated.csv' delimiter ','
 """
 
+# set boolean flag to read pre-aggregated counts (country, publications) instead of one line per PubMed-ID
+aggregated = False
+
 #create a dictionary with key country name and value amount of publications
 countries = {}
-infile = open("countries_pancreatic_cancer.csv","r")
-for line in infile:
-    country = line.strip().split(",")[1]
-    if not country in countries:
-        countries[country] = 1
-    else:
-        countries[country] += 1
-infile.close()
+if aggregated:
+    infile = open("countries_pancreatic_cancer_aggregated.csv","r")
+    for line in infile:
+        country, amount = line.strip().rsplit(",", 1)
+        countries[country] = int(amount)
+    infile.close()
+else:
+    infile = open("countries_pancreatic_cancer.csv","r")
+    for line in infile:
+        country = line.strip().split(",")[1]
+        if not country in countries:
+            countries[country] = 1
+        else:
+            countries[country] += 1
+    infile.close()
 
 # parameters for the plot
 # labels and sizes are mandatory
@@ -33,9 +33,9 @@ def get_title_text(pmid):
         article_title as title,
         abstract_text as abstract
     FROM 
-        pubmed.tbl_medline_citation
+        """+schema+""".tbl_medline_citation
             LEFT OUTER JOIN
-        pubmed.tbl_abstract
+        """+schema+""".tbl_abstract
                 ON pmid = fk_pmid
     WHERE
         pmid = '"""+pmid+"""'
@@ -50,6 +50,7 @@ def get_title_text(pmid):
 if __name__=="__main__":
     parser = OptionParser()
     parser.add_option("-d", "--database", dest="d", help='name of the database to connect to', default="pancreatic_cancer_db")
+    parser.add_option("-u", "--subset", dest="u", help='name of a subset created with PubMedSubset.py that is queried instead of the schema pubmed (optional)', default=None)
     parser.add_option("-x", "--xapian_path", dest="x", help='path to the directory containing the PubMedPortable scripts for generating the Xapian full text index',default="../../full_text_index_title_text")
     parser.add_option("-p", "--pmids_input", dest="p", help='name of the input file that contains all PubMed-IDs for the search term', default="results/results.csv")
     parser.add_option("-t", "--terms_input", dest="t", help='name of the input file that contains all search terms that should not be written to the output file', default="synonyms/pancreatic_cancer.txt")
@@ -65,6 +66,8 @@ if __name__=="__main__":
     postgres_db         = options.d
     connection          = psycopg2.connect("dbname='"+postgres_db+"' user='"+postgres_user+"' host='"+postgres_host+"' password='"+postgres_password+"' port='"+postgres_port+"'")
     cursor              = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    # schema of the tables (a subset schema has the same tables)
+    schema              = options.u or "pubmed"
 
     # save file paths in an extra variable
     pmids_input         = options.p